@@ -0,0 +1,56 @@
+"""Benchmark the converters on generated files of increasing size.
+
+Linear scaling shows up as a constant time per line across the sizes.
+"""
+
+from pathlib import Path
+from timeit import timeit
+
+from pysemco import (
+    SemanticToken,
+    SemanticTokens,
+    ansi_style_colorful,
+    compute_minimal_tokens,
+    html_style_google,
+    to_ansi,
+    to_html,
+    to_latex,
+)
+
+snippets = Path(__file__).parent.parent / "demo" / "snippets"
+code = (snippets / "demo.cpp").read_text()
+code_lines = code.splitlines()
+code_toks = compute_minimal_tokens("cpp", code)
+
+
+def repeated(num_lines: int) -> SemanticTokens:
+    """Repeat the C++ demo and its tokens until there are `num_lines` lines."""
+    reps = num_lines // len(code_lines)
+    toks = [
+        SemanticToken(
+            t.line + r * len(code_lines),
+            t.start,
+            t.length,
+            t.token_type,
+            t.token_modifiers,
+        )
+        for r in range(reps)
+        for t in code_toks
+    ]
+    return SemanticTokens("\n".join(code_lines * reps), toks)
+
+
+converters = {
+    "latex": lambda t: to_latex(t),
+    "html": lambda t: to_html(t, html_style_google),
+    "ansi": lambda t: to_ansi(t, ansi_style_colorful),
+}
+
+for num_lines in (1_000, 10_000):
+    tokens = repeated(num_lines)
+    for name, convert in converters.items():
+        secs = timeit(lambda: convert(tokens), number=3) / 3
+        print(
+            f"{name:>5} {num_lines:>6} lines: {secs * 1e3:8.2f} ms, "
+            + f"{secs / num_lines * 1e6:6.2f} µs/line"
+        )
@@ -0,0 +1,47 @@
+"""Benchmark a cold minimal analysis as run once per snippet by `pysemco_tex`.
+
+Each run starts a new interpreter, which imports `pysemco_tex`, lexes a snippet
+(compiling the lexer’s regular expressions), and then lexes it again.
+The medians of several runs are printed for each phase.
+"""
+
+import subprocess
+import sys
+from statistics import median
+
+runs = 10
+snippets = {
+    "cpp": "auto x = std::vector<int>{1, 2};",
+    "python": "def f(x: int) -> int: return x + 1",
+    "nasm": "vmovapd ymm0, ymmword ptr [rsp + 8]",
+}
+
+program = """
+import sys, time
+t0 = time.perf_counter()
+from pysemco.pysemco_tex import run
+from pysemco import compute_minimal_tokens
+t1 = time.perf_counter()
+compute_minimal_tokens(sys.argv[1], sys.argv[2])
+t2 = time.perf_counter()
+compute_minimal_tokens(sys.argv[1], sys.argv[2])
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2)
+"""
+
+for lang, code in snippets.items():
+    times: list[list[float]] = [[], [], []]
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", program, lang, code],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        for ts, t in zip(times, out.stdout.split()):
+            ts.append(float(t))
+    imp, first, second = (median(ts) * 1e3 for ts in times)
+    print(
+        f"{lang:>6}: import {imp:6.2f} ms, first lex {first:6.2f} ms, "
+        + f"second lex {second:6.2f} ms"
+    )
@@ -0,0 +1,34 @@
+"""Benchmark the minimal analysis of a large generated assembly listing."""
+
+from pathlib import Path
+from timeit import timeit
+
+from pysemco import compute_minimal_tokens
+
+snippets = Path(__file__).parent.parent / "demo" / "snippets"
+code = (snippets / "demo.asm").read_text()
+
+
+def listing(num_lines: int) -> str:
+    """Repeat the assembly demo with distinct labels until there are `num_lines` lines.
+
+    Each copy jumps to the label of the next copy, so that label uses precede
+    their definitions as in compiler output.
+    """
+    lines = code.splitlines()
+    reps = num_lines // (len(lines) + 2)
+    out: list[str] = []
+    for r in range(reps):
+        out.append(f".L{r}:")
+        out.extend(lines)
+        out.append(f"    jmp .L{r + 1}")
+    return "\n".join(out)
+
+
+for num_lines in (1_000, 10_000, 50_000):
+    txt = listing(num_lines)
+    secs = timeit(lambda: compute_minimal_tokens("nasm", txt), number=3) / 3
+    print(
+        f"nasm {num_lines:>6} lines: {secs * 1e3:8.2f} ms, "
+        + f"{secs / num_lines * 1e6:6.2f} µs/line"
+    )
@@ -0,0 +1,69 @@
+"""Benchmark the LaTeX escaping against the previous character-by-character version.
+
+The previous version is kept here as a reference, which the current one has to
+match on every token and gap of the C++ demo.
+"""
+
+from pathlib import Path
+from timeit import timeit
+
+from pysemco import SemanticTokens, compute_minimal_tokens
+from pysemco.convert.latex import _texify  # pyright: ignore[reportPrivateUsage]
+
+
+def texify_reference(txt: str, space: bool) -> str:
+    mapping = {
+        "\\": "\\SemCoBackSlash{}",
+        "{": "\\{",
+        "}": "\\}",
+        "#": "\\#",
+        "_": "\\_",
+        "&": "\\&",
+        "%": "\\%",
+        '"': "\\textquotedbl{}",
+        "'": "\\textquotesingle{}",
+        "~": "\\textasciitilde{}",
+        "(": "(\\allowbreak{}",
+        "<": "\\textless{}",
+        ">": "\\textgreater{}",
+    }
+    if space:
+        mapping[" "] = "\\SemCoSpace{}"
+    output = ""
+    for i, c in enumerate(txt):
+        if c == "(" and i + 1 < len(txt) and txt[i + 1] == ")":
+            output += c
+        else:
+            output += mapping.get(c, c)
+    return output
+
+
+snippets = Path(__file__).parent.parent / "demo" / "snippets"
+code = (snippets / "demo.cpp").read_text()
+toks = compute_minimal_tokens("cpp", code)
+
+# The strings passed to `_texify` by `to_latex`: the tokens and the gaps between them
+pieces: list[str] = []
+lines = code.splitlines()
+for line, ts in zip(lines, SemanticTokens(code, toks).line_tokens()):
+    pos = 0
+    for t in ts:
+        pieces += [line[pos : t.start], line[t.start : t.end]]
+        pos = t.end
+    pieces.append(line[pos:])
+pieces = [p for p in pieces if p] * 100
+
+workloads = {
+    "tokens and gaps": pieces,
+    "whole lines": [line for line in lines if line] * 100,
+}
+for name, data in workloads.items():
+    for space in (True, False):
+        for p in data:
+            assert _texify(p, space) == texify_reference(p, space), p
+        ref = timeit(lambda: [texify_reference(p, space) for p in data], number=5) / 5
+        new = timeit(lambda: [_texify(p, space) for p in data], number=5) / 5
+        print(
+            f"{name:>15}, space={space!s:>5}: reference {ref * 1e3:6.2f} ms, "
+            + f"current {new * 1e3:6.2f} ms ({ref / new:.1f}× faster)"
+        )
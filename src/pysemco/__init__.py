@@ -2,18 +2,27 @@ from .convert import HtmlDisplay as HtmlDisplay
 from .convert import ansi_style_colorful as ansi_style_colorful
 from .convert import html_div as html_div
 from .convert import html_style_google as html_style_google
+from .convert import iter_ansi as iter_ansi
+from .convert import iter_html as iter_html
+from .convert import iter_html_div as iter_html_div
+from .convert import iter_latex as iter_latex
+from .convert import iter_latex_line_merge as iter_latex_line_merge
 from .convert import latex_line_merge as latex_line_merge
 from .convert import latex_token as latex_token
 from .convert import to_ansi as to_ansi
 from .convert import to_html as to_html
 from .convert import to_latex as to_latex
+from .tokens import ColumnarTokens as ColumnarTokens
 from .tokens import SemanticToken as SemanticToken
 from .tokens import SemanticTokens as SemanticTokens
+from .tokens import TokenFile as TokenFile
 from .tokens import combine_tokens as combine_tokens
 from .tokens import compute_minimal_tokens as compute_minimal_tokens
 from .tokens import compute_tokens as compute_tokens
+from .tokens import compute_tokens_many as compute_tokens_many
 from .tokens import compute_tokens_cpp as compute_tokens_cpp
 from .tokens import compute_tokens_python as compute_tokens_python
 from .tokens import compute_tokens_sync as compute_tokens_sync
 from .tokens import parse_semantic_tokens as parse_semantic_tokens
 from .tokens import semantic_tokens as semantic_tokens
+from .tokens import write_binary_tokens as write_binary_tokens
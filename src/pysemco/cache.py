@@ -0,0 +1,297 @@
+import json
+import os
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from .serialization import deserialize, serialize
+from .state import data_path, replace_atomic, version_check, write_atomic
+from .tokens import SemanticTokens
+
+# The language servers whose results are part of the analysis of each language
+_language_servers = {"cpp": "clangd", "python": "basedpyright"}
+
+# The directory in which analyses are stored by their key
+store_path = data_path / "analyses"
+# The time after which analyses that have not been used are removed from the store
+store_max_age = timedelta(days=30)
+
+# The version of the analyses computed by pysemco, which is part of their keys.
+# It needs to be increased whenever a change to pysemco changes the computed tokens.
+analysis_version = 1
+
+
+@dataclass
+class AnalysisManifest:
+    """The inputs of an analysis, which are stored next to it.
+
+    Comparing the manifest with the current inputs determines whether an analysis can
+    be re-used without loading its tokens. The key is a hash of all other fields
+    and names the analysis in the shared store, so that documents analyzing the same
+    code share one analysis.
+    """
+
+    key: str
+    language: str
+    # The project root, which is only relevant for languages with a language server
+    root: str
+    source_hash: str
+    # The versions of pysemco, its analyses, pygments, and the language server, if any
+    versions: dict[str, str]
+    # The range of lines analyzed (beginning and end, exclusive), empty for all lines
+    lines: list[int]
+
+
+def is_json_path(dst: Path) -> bool:
+    """Whether the analysis at `dst` is stored as JSON instead of the binary format."""
+    return dst.suffix == ".json"
+
+
+def _stored_path(dst: Path, manifest: AnalysisManifest) -> Path:
+    """The path in the shared store of the analysis for `dst` with the given manifest."""
+    return store_path / (manifest.key + (".json" if is_json_path(dst) else ".tokens"))
+
+
+def _sha256(data: str) -> str:
+    import hashlib
+
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _versions(language: str) -> dict[str, str]:
+    """The versions of the tools involved in analyzing the given language."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    from pygments import __version__ as pygments_version
+
+    try:
+        pysemco_version = version("pysemco")
+    except PackageNotFoundError:
+        # Running from a source checkout that is not installed
+        pysemco_version = "source"
+    versions = {
+        "pysemco": pysemco_version,
+        "analysis": str(analysis_version),
+        "pygments": pygments_version,
+    }
+    if (server := _language_servers.get(language)) is not None:
+        verch = version_check(server)
+        versions[server] = "" if verch is None else verch.version
+    return versions
+
+
+def analysis_manifest(
+    language: str,
+    root: Path,
+    txt: str,
+    lines: tuple[int, int] | None = None,
+) -> AnalysisManifest:
+    """The manifest of analyzing the source code `txt` with the current tools.
+
+    Args:
+        language: The programming language of the source code.
+        root: The root path of the source code’s project.
+        txt: The source code.
+        lines: The range of lines analyzed, if not all of them.
+    """
+    manifest = AnalysisManifest(
+        key="",
+        language=language,
+        root=str(root) if language in _language_servers else "",
+        source_hash=_sha256(txt),
+        versions=_versions(language),
+        lines=[] if lines is None else list(lines),
+    )
+    manifest.key = _sha256(json.dumps(serialize(manifest), sort_keys=True))
+    return manifest
+
+
+def manifest_path(dst: Path) -> Path:
+    """The path of the manifest of the analysis stored at `dst`.
+
+    The manifest is named after the whole file name, so that the analyses `a.json`
+    and `a.tokens` in the same directory have different manifests.
+    """
+    return dst.with_name(dst.name + ".manifest.json")
+
+
+def read_manifest(dst: Path) -> AnalysisManifest | None:
+    """The manifest of the analysis stored at `dst`, or None if there is none."""
+    try:
+        with open(manifest_path(dst), "r") as f:
+            return deserialize(json.load(f), AnalysisManifest)
+    except (OSError, ValueError, KeyError, AssertionError):
+        return None
+
+
+def write_tokens(dst: Path, tokens: SemanticTokens, as_json: bool = False) -> None:
+    """Atomically write tokens to `dst` in the binary format or as JSON.
+
+    Files in the binary format are never changed in place, so that memory-mapping
+    them is safe while they are replaced.
+    """
+    from .tokens.binary import write_binary_tokens
+
+    def write(path: Path) -> None:
+        with open(path, "wb") as f:
+            write_binary_tokens(f, tokens)
+
+    if as_json:
+        write_atomic(dst, json.dumps(tokens.json))
+    else:
+        replace_atomic(dst, write)
+
+
+def _link(src: Path, dst: Path) -> None:
+    """Atomically make `dst` a hard link to `src`, or a copy if that fails."""
+    import shutil
+
+    def write(path: Path) -> None:
+        try:
+            os.link(src, path)
+        except OSError:
+            shutil.copyfile(src, path)
+
+    replace_atomic(dst, write)
+
+
+def is_current(dst: Path, manifest: AnalysisManifest) -> bool:
+    """Whether `dst` contains an analysis with the given manifest."""
+    stored = read_manifest(dst)
+    return stored is not None and stored.key == manifest.key and dst.exists()
+
+
+def restore_analysis(dst: Path, manifest: AnalysisManifest) -> bool:
+    """Provide the analysis with the given manifest at `dst` if it has been stored.
+
+    Returns:
+        Whether the analysis has been found in the shared store.
+    """
+    stored = _stored_path(dst, manifest)
+    try:
+        # Mark the analysis as used, which keeps `prune_store` from removing it.
+        os.utime(stored)
+        _link(stored, dst)
+    except FileNotFoundError:
+        # The analysis has not been stored or has just been pruned.
+        return False
+    write_atomic(manifest_path(dst), json.dumps(serialize(manifest)))
+    return True
+
+
+def adopt_analysis(dst: Path, manifest: AnalysisManifest) -> None:
+    """Add the existing analysis at `dst` to the shared store under `manifest`."""
+    store_path.mkdir(exist_ok=True)
+    _link(dst, _stored_path(dst, manifest))
+    write_atomic(manifest_path(dst), json.dumps(serialize(manifest)))
+
+
+def save_analysis(
+    dst: Path, manifest: AnalysisManifest, tokens: SemanticTokens
+) -> None:
+    """Store an analysis in the shared store and at `dst`.
+
+    Args:
+        dst: The path to provide the analysis at, which is stored as JSON
+            if it ends in “.json” and in the binary format otherwise.
+        manifest: The manifest describing the inputs of the analysis.
+        tokens: The result of the analysis.
+    """
+    store_path.mkdir(exist_ok=True)
+    stored = _stored_path(dst, manifest)
+    write_tokens(stored, tokens, as_json=is_json_path(dst))
+    _link(stored, dst)
+    write_atomic(manifest_path(dst), json.dumps(serialize(manifest)))
+    prune_store()
+
+
+def prune_store() -> None:
+    """Remove the analyses that have not been used for `store_max_age` from the store.
+
+    The store is only scanned once a day, which is recorded by the modification time
+    of a marker file. Removing an analysis from the store does not affect the copies
+    provided at other paths, as these are separate links or copies.
+    """
+    import time
+
+    marker = store_path / ".pruned"
+    now = time.time()
+    try:
+        if now - marker.stat().st_mtime < timedelta(days=1).total_seconds():
+            return
+    except FileNotFoundError:
+        pass
+    marker.touch()
+
+    max_age = store_max_age.total_seconds()
+    with os.scandir(store_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                # Another process has pruned the analysis as well.
+                pass
+
+
+@dataclass
+class TexCacheEntry:
+    """An output of pysemco_tex that the LaTeX package stores to avoid recomputing it."""
+
+    # The LaTeX command storing the output, e.g. `\@semco@store@part@cache`
+    command: str
+    # The arguments identifying the output, formatted for LaTeX
+    arguments: str
+    # The output without the trailing `%`
+    output: str
+    # The name of the analysis the output is derived from, if any
+    analysis: str | None
+
+    @property
+    def tex(self) -> str:
+        """The line storing the output when input by LaTeX."""
+        return f"{self.command}{self.arguments}{{{self.output}}}\n"
+
+
+class TexCache:
+    """The outputs stored for the LaTeX package together with their dependencies.
+
+    The entries are stored as JSON lines in `cache.jsonl` and as the corresponding
+    LaTeX commands in `.cache`, which LaTeX inputs directly. New entries are appended
+    to both files, while invalidating the entries that depend on an analysis
+    rewrites them.
+
+    Args:
+        directory: The directory containing the cache files.
+    """
+
+    def __init__(self, directory: Path):
+        self.entries_path = directory / "cache.jsonl"
+        self.tex_path = directory / ".cache"
+
+    def _entries(self) -> list[TexCacheEntry]:
+        if not self.entries_path.exists():
+            return []
+        with open(self.entries_path, "r") as f:
+            return [deserialize(json.loads(line), TexCacheEntry) for line in f]
+
+    def add(self, entry: TexCacheEntry) -> None:
+        """Store a new entry."""
+        with open(self.entries_path, "a") as f:
+            f.write(json.dumps(serialize(entry)) + "\n")
+        with open(self.tex_path, "a") as f:
+            f.write(entry.tex)
+
+    def invalidate(self, *analyses: str) -> None:
+        """Remove the entries derived from the analyses with the given names.
+
+        This also removes the lines in `.cache` not written by this class.
+        """
+        entries = [e for e in self._entries() if e.analysis not in analyses]
+        write_atomic(
+            self.entries_path,
+            "".join(json.dumps(serialize(e)) + "\n" for e in entries),
+        )
+        write_atomic(self.tex_path, "".join(e.tex for e in entries))
@@ -1,9 +1,14 @@
 from .ansi import ansi_style_colorful as ansi_style_colorful
+from .ansi import iter_ansi as iter_ansi
 from .ansi import to_ansi as to_ansi
 from .html import HtmlDisplay as HtmlDisplay
 from .html import html_div as html_div
 from .html import html_style_google as html_style_google
+from .html import iter_html as iter_html
+from .html import iter_html_div as iter_html_div
 from .html import to_html as to_html
+from .latex import iter_latex as iter_latex
+from .latex import iter_latex_line_merge as iter_latex_line_merge
 from .latex import latex_line_merge as latex_line_merge
 from .latex import latex_token as latex_token
 from .latex import to_latex as to_latex
@@ -1,3 +1,5 @@
+from collections.abc import Iterator
+
 from pysemco.convert.colors import StyleDict, colorful
 
 from ..tokens import SemanticToken, SemanticTokens
@@ -27,6 +29,44 @@ ansi_style_colorful = colorful(
 _reset_all = _code_to_chars(0)
 
 
+def _ansi_line(line: str, ts: list[SemanticToken], token_style: dict[str, str]) -> str:
+    """Convert a single line with its tokens into an ANSI-styled string."""
+    if len(ts) == 0:
+        # If there are no tokens in this line, add it without formatting.
+        return line
+    ansi_line = ""
+    prev: SemanticToken | None = None
+    for t in ts:
+        prefix = line[prev.end if prev is not None else 0 : t.start]
+        ansi_line += prefix
+
+        style = token_style.get(t.token_type)
+        tok = line[t.start : t.end]
+        ansi_line += f"{style}{tok}{_reset_all}" if style is not None else tok
+
+        prev = t
+    assert prev is not None
+    ansi_line += line[prev.end :]
+    return ansi_line
+
+
+def iter_ansi(
+    tokens: SemanticTokens,
+    token_style: dict[str, str],
+    lines: tuple[int, int] | None = None,
+) -> Iterator[str]:
+    """Convert the tokenized code into ANSI-styled lines without line breaks.
+
+    Args:
+        tokens: The semantic tokens.
+        token_style: A style to highlight the tokens with.
+        lines: The range of lines (beginning and end, exclusive) to convert,
+            by default all lines.
+    """
+    for line, ts in tokens.iter_lines(lines):
+        yield _ansi_line(line, ts, token_style)
+
+
 def to_ansi(
     tokens: SemanticTokens,
     token_style: dict[str, str],
@@ -37,27 +77,4 @@ def to_ansi(
         tokens: The semantic tokens.
         token_style: A style to highlight the tokens with.
     """
-
-    lines = tokens.txt.splitlines()
-    ansi_lines: list[str] = []
-    for i, line in enumerate(lines):
-        ts = [x for x in tokens.toks if x.line == i]
-        if len(ts) == 0:
-            # If there are no tokens in this line, add it without formatting.
-            ansi_line = line
-        else:
-            ansi_line = ""
-            prev: SemanticToken | None = None
-            for t in ts:
-                prefix = line[prev.end if prev is not None else 0 : t.start]
-                ansi_line += prefix
-
-                style = token_style.get(t.token_type)
-                tok = line[t.start : t.end]
-                ansi_line += f"{style}{tok}{_reset_all}" if style is not None else tok
-
-                prev = t
-            assert prev is not None
-            ansi_line += line[prev.end :]
-        ansi_lines.append(ansi_line)
-    return "\n".join(ansi_lines)
+    return "\n".join(iter_ansi(tokens, token_style))
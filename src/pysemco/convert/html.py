@@ -1,4 +1,7 @@
+from collections.abc import Iterable, Iterator
+from html import escape
 from typing import final
+
 from pysemco.convert.colors import StyleDict, colorful
 
 from ..tokens import SemanticToken, SemanticTokens
@@ -21,6 +24,44 @@ html_style_google = colorful(
 )
 
 
+def _html_line(line: str, ts: list[SemanticToken], token_style: dict[str, str]) -> str:
+    """Convert a single line with its tokens into HTML."""
+    if len(ts) == 0:
+        # If there are no tokens in this line, add it without formatting.
+        return escape(line, quote=False)
+    html_line = ""
+    prev: SemanticToken | None = None
+    for t in ts:
+        prefix = line[prev.end if prev is not None else 0 : t.start]
+        html_line += escape(prefix, quote=False)
+
+        style = token_style.get(t.token_type)
+        tok = escape(line[t.start : t.end], quote=False)
+        html_line += f'<span style="{style}">{tok}</span>' if style is not None else tok
+
+        prev = t
+    assert prev is not None
+    html_line += escape(line[prev.end :], quote=False)
+    return html_line
+
+
+def iter_html(
+    tokens: SemanticTokens,
+    token_style: dict[str, str],
+    lines: tuple[int, int] | None = None,
+) -> Iterator[str]:
+    """Convert the tokenized code into HTML one line at a time.
+
+    Args:
+        tokens: The semantic tokens.
+        token_style: A style to highlight the tokens with.
+        lines: The range of lines (beginning and end, exclusive) to convert,
+            by default all lines.
+    """
+    for line, ts in tokens.iter_lines(lines):
+        yield _html_line(line, ts, token_style)
+
+
 def to_html(
     tokens: SemanticTokens,
     token_style: dict[str, str],
@@ -31,43 +72,20 @@ def to_html(
         tokens: The semantic tokens.
         token_style: A style to highlight the tokens with.
     """
+    return list(iter_html(tokens, token_style))
 
-    from html import escape
 
-    lines = tokens.txt.splitlines()
-    html_lines: list[str] = []
+def iter_html_div(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the parts of `html_div(lines)` one line at a time."""
+    yield '<div style="font-family:monospace;white-space: pre;">'
     for i, line in enumerate(lines):
-        ts = [x for x in tokens.toks if x.line == i]
-        if len(ts) == 0:
-            # If there are no tokens in this line, add it without formatting.
-            html_line = escape(line, quote=False)
-        else:
-            html_line = ""
-            prev: SemanticToken | None = None
-            for t in ts:
-                prefix = line[prev.end if prev is not None else 0 : t.start]
-                html_line += escape(prefix, quote=False)
-
-                style = token_style.get(t.token_type)
-                tok = escape(line[t.start : t.end], quote=False)
-                html_line += (
-                    f'<span style="{style}">{tok}</span>' if style is not None else tok
-                )
-
-                prev = t
-            assert prev is not None
-            html_line += escape(line[prev.end :], quote=False)
-        html_lines.append(html_line)
-    return html_lines
-
-
-def html_div(lines: list[str]) -> str:
+        yield line if i == 0 else f"<br/>{line}"
+    yield "</div>"
+
+
+def html_div(lines: Iterable[str]) -> str:
     """Join HTML lines into a monospaced <div> with <br/> between the lines."""
-    return (
-        '<div style="font-family:monospace;white-space: pre;">'
-        + "<br/>".join(lines)
-        + "</div>"
-    )
+    return "".join(iter_html_div(lines))
 
 
 @final
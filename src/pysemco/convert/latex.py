@@ -1,5 +1,45 @@
+import re
+from collections.abc import Iterable, Iterator
+
 from ..tokens import SemanticToken, SemanticTokens
 
+# The LaTeX replacements of characters that cannot be used verbatim
+_latex_escapes = {
+    "\\": "\\SemCoBackSlash{}",
+    "{": "\\{",
+    "}": "\\}",
+    "#": "\\#",
+    "_": "\\_",
+    "&": "\\&",
+    "%": "\\%",
+    '"': "\\textquotedbl{}",
+    "'": "\\textquotesingle{}",
+    "~": "\\textasciitilde{}",
+    "<": "\\textless{}",
+    ">": "\\textgreater{}",
+}
+
+
+def _translation_table(escapes: dict[str, str]) -> dict[int, int | str]:
+    """A `str.translate` table applying `escapes` and keeping other Latin-1 characters.
+
+    `str.translate` looks up each character in the table and handles missing ones
+    by catching a `LookupError`, which is much slower than a successful lookup.
+    """
+    table: dict[int, int | str] = {i: i for i in range(256)}
+    table.update(str.maketrans(escapes))
+    return table
+
+
+# The translation tables keeping spaces (index 0) or replacing them (index 1)
+_texify_tables = (
+    _translation_table(_latex_escapes),
+    _translation_table({**_latex_escapes, " ": "\\SemCoSpace{}"}),
+)
+# An opening parenthesis that is not directly followed by a closing one,
+# after which a line break is allowed
+_break_paren = re.compile(r"\((?!\))")
+
 
 def _texify(txt: str, space: bool) -> str:
     """Convert single-line text into a LaTeX-friendly variant.
@@ -12,29 +52,10 @@ def _texify(txt: str, space: bool) -> str:
             Keeping spaces (`False`) allows for line wrapping.
     """
 
-    mapping = {
-        "\\": "\\SemCoBackSlash{}",
-        "{": "\\{",
-        "}": "\\}",
-        "#": "\\#",
-        "_": "\\_",
-        "&": "\\&",
-        "%": "\\%",
-        '"': "\\textquotedbl{}",
-        "'": "\\textquotesingle{}",
-        "~": "\\textasciitilde{}",
-        "(": "(\\allowbreak{}",
-        "<": "\\textless{}",
-        ">": "\\textgreater{}",
-    }
-    if space:
-        mapping[" "] = "\\SemCoSpace{}"
-    output = ""
-    for i, c in enumerate(txt):
-        if c == "(" and i + 1 < len(txt) and txt[i + 1] == ")":
-            output += c
-        else:
-            output += mapping.get(c, c)
+    # None of the replacements contains parentheses, so they can be handled after.
+    output = txt.translate(_texify_tables[space])
+    if "(" in output:
+        output = _break_paren.sub(r"(\\allowbreak{}", output)
     return output
 
 
@@ -50,6 +71,40 @@ def latex_token(txt: str, token_type: str, space: bool = True) -> str:
     return f"\\SemCoFormat{{{token_type}}}{{{_texify(txt, space)}}}"
 
 
+def _latex_line(line: str, ts: list[SemanticToken], space: bool) -> str:
+    """Convert a single line with its tokens into LaTeX SemCo macros.
+
+    The unformatted runs between the tokens are converted as a whole.
+    """
+    parts: list[str] = []
+    pos = 0
+    for t in ts:
+        if pos < t.start:
+            parts.append(_texify(line[pos : t.start], space))
+        parts.append(latex_token(line[t.start : t.end], t.token_type))
+        pos = t.end
+    if pos < len(line):
+        parts.append(_texify(line[pos:], space))
+    return "".join(parts) or "\\ "
+
+
+def iter_latex(
+    tokens: SemanticTokens,
+    space: bool = True,
+    lines: tuple[int, int] | None = None,
+) -> Iterator[str]:
+    """Convert the given code into LaTeX SemCo macros one line at a time.
+
+    Args:
+        tokens: The tokens used for formatting the code.
+        space: Whether to replace spaces with a SemCo-specific macro.
+        lines: The range of lines (beginning and end, exclusive) to convert,
+            by default all lines.
+    """
+    for line, ts in tokens.iter_lines(lines):
+        yield _latex_line(line, ts, space)
+
+
 def to_latex(tokens: SemanticTokens, space: bool = True) -> list[str]:
     """Convert the given code with corresponding tokens into LaTeX SemCo macros.
 
@@ -57,33 +112,20 @@ def to_latex(tokens: SemanticTokens, space: bool = True) -> list[str]:
         tokens: The tokens used for formatting the code.
         space: Whether to replace spaces with a SemCo-specific macro.
     """
+    return list(iter_latex(tokens, space))
+
+
+def iter_latex_line_merge(lines: Iterable[str]) -> Iterator[str]:
+    """Merge LaTeX lines like `latex_line_merge`, yielding each line with its ending."""
+    it = iter(lines)
+    if (prev := next(it, None)) is None:
+        return
+    for line in it:
+        yield f"{prev}\\\\\n"
+        prev = line
+    yield f"{prev}%"
+
 
-    lines = tokens.txt.splitlines()
-    latex_lines: list[str] = []
-    for i, line in enumerate(lines):
-        ts = [x for x in tokens.toks if x.line == i]
-        if len(ts) == 0:
-            # If there are no tokens in this line, add it without formatting.
-            latex_line = f"{_texify(line, space)}"
-        else:
-            latex_line = ""
-            prev: SemanticToken | None = None
-            for t in ts:
-                prefix = line[prev.end if prev is not None else 0 : t.start]
-                latex_line += _texify(prefix, space)
-                latex_line += latex_token(line[t.start : t.end], t.token_type)
-                prev = t
-            assert prev is not None
-            latex_line += _texify(line[prev.end :], space)
-        if len(latex_line) == 0:
-            latex_line = "\\ "
-        latex_lines.append(latex_line)
-    return latex_lines
-
-
-def latex_line_merge(lines: list[str]) -> str:
+def latex_line_merge(lines: Iterable[str]) -> str:
     r"""Merge LaTeX lines using \\\\."""
-    return "\n".join(
-        f"{line}\\\\" if i + 1 < len(lines) else f"{line}%"
-        for i, line in enumerate(lines)
-    )
+    return "".join(iter_latex_line_merge(lines))
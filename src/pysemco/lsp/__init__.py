@@ -1,3 +1,6 @@
 from .clangd import ClangdServer as ClangdServer
 from .language_server import LanguageServer as LanguageServer
+from .language_server import apply_semantic_token_edits as apply_semantic_token_edits
+from .pool import LanguageServerPool as LanguageServerPool
+from .pool import default_pool as default_pool
 from .pyright import PyrightServer as PyrightServer
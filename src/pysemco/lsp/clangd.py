@@ -1,9 +1,11 @@
+import asyncio
 import json
 import logging
 import os
 import shlex
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from importlib.resources import files
 from pathlib import Path
 
@@ -13,12 +15,142 @@ from multilspy.lsp_protocol_handler.server import ProcessLaunchInfo
 from multilspy.multilspy_config import MultilspyConfig
 from multilspy.multilspy_logger import MultilspyLogger
 
+from ..state import data_path, workspace_dir, write_atomic
 from ..tokens.defs import StrPath
 from .download.clangd import get_clangd_path
-from .language_server import LanguageServer
+from .language_server import LanguageServer, shutdown_timeout
+
+# The environment variable setting the number of clangd’s worker threads (`-j`)
+jobs_env = "PYSEMCO_CLANGD_JOBS"
+
+# The compile flags used in workspaces without their own compilation database
+default_compile_flags = ["-xc++"]
+
+# The environment variable that keeps pysemco from generating a compilation database
+# if set to “0”, so that clangd only uses the ones it finds itself
+database_env = "PYSEMCO_CLANGD_DATABASE"
+
+# The suffixes of the C++ files listed in generated compilation databases
+_cpp_suffixes = set(".c .cc .cpp .cxx .c++ .h .hh .hpp .hxx .ipp".split())
+# The maximum number of files listed in a generated compilation database
+_max_sources = 1000
+# The age up to which a generated compilation database is used without searching
+# the workspace again
+_max_database_age = timedelta(hours=1)
+
+# The files through which clangd finds a project’s compilation database
+_compilation_databases = (
+    "compile_commands.json",
+    "build/compile_commands.json",
+    "compile_flags.txt",
+)
+# The names of the files in `_compilation_databases`
+_database_names = {Path(db).name for db in _compilation_databases}
+
+
+def _sources(root: Path) -> list[Path] | None:
+    """The C++ files in the workspace, or None if it contains a compilation database.
+
+    clangd searches for the compilation database of a file in the file’s directory
+    and its parents, so a database in any directory of the workspace is used for
+    some of its files. Hidden directories are skipped. At most `_max_sources` files
+    are returned, as clangd infers the commands of unlisted files from the listed
+    ones in the same directories.
+    """
+    sources: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if not _database_names.isdisjoint(filenames):
+            return None
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if len(sources) < _max_sources and Path(name).suffix in _cpp_suffixes:
+                sources.append(Path(dirpath, name))
+    return sources
+
+
+def _prepare_workspace(root: Path, compile_flags: list[str]) -> Path | None:
+    """Generate the compilation database for a workspace if clangd would find none.
+
+    The database lists the workspace’s C++ files, which clangd indexes in the
+    background, while `compile_flags.txt` covers the case that there are none yet,
+    in which case no database is written.
+    The workspace is only searched again once the database is older than
+    `_max_database_age`, as clangd also infers the commands of files added since.
+
+    Returns:
+        The directory containing the generated database, or None if clangd finds
+        a compilation database in the workspace, its parents, or their `build`
+        directories.
+    """
+    import json
+
+    root = root.resolve()
+    if any(
+        (d / db).exists()
+        for d in (root, *root.parents)
+        for db in _compilation_databases
+    ):
+        return None
+    dir = workspace_dir(root)
+    dir.mkdir(parents=True, exist_ok=True)
+
+    # Headers are also searched relative to the root, as in the workspace itself.
+    flags = [*compile_flags, f"-I{root}"]
+    flags_txt = "".join(f"{flag}\n" for flag in flags)
+    flags_path = dir / "compile_flags.txt"
+    # The marker records when the workspace has last been searched.
+    marker = dir / ".searched"
+    try:
+        age = datetime.now() - datetime.fromtimestamp(marker.stat().st_mtime)
+        if age < _max_database_age and flags_path.read_text() == flags_txt:
+            return dir
+    except FileNotFoundError:
+        pass
+
+    if (sources := _sources(root)) is None:
+        return None
+    commands = [
+        {
+            "directory": str(root),
+            "file": str(src),
+            "arguments": ["clang++", *flags, str(src)],
+        }
+        for src in sources
+    ]
+    files = {flags_path.name: flags_txt}
+    commands_path = dir / "compile_commands.json"
+    if commands:
+        files[commands_path.name] = json.dumps(commands, indent=2)
+    else:
+        # An empty database would hide `compile_flags.txt` from clangd.
+        commands_path.unlink(missing_ok=True)
+    for name, contents in files.items():
+        path = dir / name
+        # Changing the files would make clangd rebuild its preambles and index.
+        if not path.exists() or path.read_text() != contents:
+            write_atomic(path, contents)
+    marker.touch()
+    return dir
 
 
 class ClangdServer(LanguageServer):
+    """clangd with a persistent background index and preambles stored on disk.
+
+    Args:
+        logger: The logger.
+        root: The root of the workspace.
+        clangd_cmd: The clangd executable, which is downloaded if not given.
+        trace_lsp_communication: Whether to log the messages exchanged with clangd.
+        log_lsp: Whether to log the state of the downloaded clangd.
+        jobs: The number of clangd’s worker threads, by default the value of the
+            environment variable `PYSEMCO_CLANGD_JOBS` or clangd’s default.
+        compile_flags: The flags to compile files with if the workspace has no
+            compilation database, by default `default_compile_flags`.
+        generate_database: Whether to generate a compilation database if clangd
+            finds none, by default unless the environment variable
+            `PYSEMCO_CLANGD_DATABASE` is “0”. Without it, clangd uses its defaults.
+    """
+
     def __init__(
         self,
         logger: MultilspyLogger,
@@ -27,14 +159,33 @@ class ClangdServer(LanguageServer):
         clangd_cmd: StrPath | None = None,
         trace_lsp_communication: bool = False,
         log_lsp: bool,
+        jobs: int | None = None,
+        compile_flags: list[str] | None = None,
+        generate_database: bool | None = None,
     ):
         if clangd_cmd is None:
             clangd_cmd = get_clangd_path(log_lsp)
+        if jobs is None and (env_jobs := os.environ.get(jobs_env)) is not None:
+            jobs = int(env_jobs)
+
+        args = [str(clangd_cmd), "--background-index", "--pch-storage=disk"]
+        if jobs is not None:
+            args.append(f"-j={jobs}")
+        if generate_database is None:
+            generate_database = os.environ.get(database_env) != "0"
+        # The workspace is searched in `start_server` to keep the event loop free.
+        self._database_flags = (
+            (compile_flags or default_compile_flags) if generate_database else None
+        )
+        self._args = args
+        # Files without a compilation database are indexed in the cache directory.
+        env = {"XDG_CACHE_HOME": str(data_path / "cache")}
+
         super().__init__(
             MultilspyConfig("cpp", trace_lsp_communication),  # pyright: ignore
             logger,
             str(root),
-            ProcessLaunchInfo(cmd=shlex.quote(str(clangd_cmd))),
+            ProcessLaunchInfo(cmd=shlex.join(args), env=env),
             "cpp",
         )
         self.init_response: InitializeResult | None = None
@@ -72,6 +223,21 @@ class ClangdServer(LanguageServer):
         self.server.on_notification("textDocument/publishDiagnostics", noop)
         self.server.on_notification("language/actionableNotification", noop)
 
+        if self._database_flags is not None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Not the loop’s default executor, which `run_sync` could not shut
+            # down when closing its event loop at exit.
+            loop = asyncio.get_running_loop()
+            root = Path(self.repository_root_path)
+            with ThreadPoolExecutor(1) as executor:
+                flags_dir = await loop.run_in_executor(
+                    executor, _prepare_workspace, root, self._database_flags
+                )
+            if flags_dir is not None:
+                args = [*self._args, f"--compile-commands-dir={flags_dir}"]
+                self.server.process_launch_info.cmd = shlex.join(args)
+
         async with super().start_server():
             self.logger.log("Starting clangd server process", logging.INFO)
             await self.server.start()
@@ -90,9 +256,10 @@ class ClangdServer(LanguageServer):
 
             yield self
 
-            # Best-effort shutdown; if the process already exited, ignore it.
+            # Best-effort shutdown, which a server that has exited cannot answer.
             try:
-                await self.server.shutdown()
+                if self.is_running():
+                    await asyncio.wait_for(self.server.shutdown(), shutdown_timeout)
             except Exception as exc:
                 self.logger.log(f"Error during LSP shutdown: {exc}", logging.WARNING)
             try:
@@ -1,13 +1,34 @@
+import os
 import platform
+import re
 import sys
 import zipfile
-from io import BytesIO
+from collections.abc import Callable
+from functools import partial
 from pathlib import Path
 from shutil import rmtree
+from typing import TYPE_CHECKING
 
 import requests
 
-from pysemco.lsp.download.defs import data_path, github, update_version, version_check
+from pysemco.lsp.download.defs import github, prune_installs
+from pysemco.state import (
+    VersionCheck,
+    check_for_updates,
+    data_path,
+    is_offline,
+    lock,
+    offline_env,
+    update_version,
+    version_check,
+)
+
+if TYPE_CHECKING:
+    from github.GitRelease import GitRelease
+
+# The environment variable naming a clangd release archive or a directory of them
+# (named as on GitHub) to install from instead of downloading from GitHub
+mirror_env = "PYSEMCO_CLANGD_MIRROR"
 
 
 def _system_prefix() -> str:
@@ -23,52 +44,238 @@ def _system_prefix() -> str:
     return prefix
 
 
-def _get_dir(log: bool) -> Path:
-    """Determine the path to store clangd at, optionally logging the LSP state."""
-    verch = version_check("clangd")
-    if verch is not None and not verch.check:
-        if log:
-            print("clangd is up to date!", file=sys.stderr)
-        return data_path / f"clangd-{verch.version}"
+def _mirror_archive() -> tuple[str, Path] | None:
+    """The version and path of the clangd archive in the mirror, if one is set.
 
-    clangd = github().get_repo("clangd/clangd")
-    release = clangd.get_latest_release()
-    version = release.name
-    if verch is not None and verch.version == version:
-        if log:
-            print("clangd version checked and up to date!", file=sys.stderr)
-        update_version("clangd", version)
-        return data_path / f"clangd-{version}"
+    If the mirror is a directory, the newest archive for this system is used.
+    """
+    if (mirror := os.environ.get(mirror_env)) is None:
+        return None
+    prefix = _system_prefix()
+    path = Path(mirror)
+    if path.is_dir():
+        archives = list(path.glob(f"{prefix}*.zip"))
+        if len(archives) == 0:
+            raise RuntimeError(f"There is no {prefix}*.zip in {path}!")
+        path = max(archives, key=lambda p: [int(n) for n in re.findall(r"\d+", p.name)])
+    return path.name.removeprefix(prefix).removesuffix(".zip"), path
 
-    dir = data_path / f"clangd-{version}"
+
+def _sha256(path: Path) -> str:
+    import hashlib
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _verify(path: Path, sha256: str | None, size: int | None = None) -> None:
+    """Check the size and SHA-256 hash of a file if they are known."""
+    if size is not None and (actual := path.stat().st_size) != size:
+        raise RuntimeError(f"{path} has {actual} bytes instead of {size}!")
+    if sha256 is not None and (actual := _sha256(path)) != sha256:
+        raise RuntimeError(f"{path} has the SHA-256 hash {actual} instead of {sha256}!")
+
+
+def _download(url: str, dst: Path, sha256: str | None, size: int | None) -> None:
+    """Download a file in chunks, resuming an earlier partial download.
+
+    The data is written to `dst` with “.part” appended, which is only renamed
+    to `dst` once it has been verified and removed if the verification fails.
+
+    Args:
+        url: The URL of the file.
+        dst: The path to store the file at.
+        sha256: The expected SHA-256 hash of the file, if known.
+        size: The expected size of the file, if known.
+    """
+    part = dst.with_name(f"{dst.name}.part")
+    pos = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={pos}-"} if pos > 0 else {}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as resp:
+        # 416 means that the partial download is already complete.
+        if resp.status_code != 416:
+            resp.raise_for_status()
+            # The server may ignore the range and send the whole file.
+            with open(part, "ab" if resp.status_code == 206 else "wb") as f:
+                for chunk in resp.iter_content(1 << 20):
+                    f.write(chunk)
+    try:
+        _verify(part, sha256, size)
+    except RuntimeError:
+        part.unlink()
+        raise
+    os.replace(part, dst)
+
+
+def _extract(archive: Path, dst: Path) -> None:
+    """Extract a zip archive into `dst` using one thread per core.
+
+    Each thread opens the archive on its own and decompresses its share of
+    the files, as zlib releases the GIL while decompressing.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with zipfile.ZipFile(archive) as zip:
+        infos = zip.infolist()
+    root = dst.resolve()
+    for info in infos:
+        path = (root / info.filename).resolve()
+        if root not in path.parents:
+            raise RuntimeError(f"{archive} contains the invalid path {info.filename}!")
+        # Create the directories first, so that the threads do not race to do so.
+        (path if info.is_dir() else path.parent).mkdir(parents=True, exist_ok=True)
+    files = sorted(
+        (i for i in infos if not i.is_dir()), key=lambda i: i.file_size, reverse=True
+    )
+
+    num_threads = min(len(files), os.cpu_count() or 1, 8)
+
+    def extract(index: int) -> None:
+        with zipfile.ZipFile(archive) as zip:
+            for info in files[index::num_threads]:
+                zip.extract(info, dst)
+
+    if num_threads > 0:
+        with ThreadPoolExecutor(num_threads) as pool:
+            list(pool.map(extract, range(num_threads)))
+
+
+def _install(archive: Path, dir: Path) -> None:
+    """Install clangd from a release archive at `dir`, replacing it atomically.
+
+    The caller needs to hold the lock named “clangd”.
+    """
+    # Temporary directories of other processes are left over from interrupted installs.
+    for stale in data_path.glob(".clangd-*.tmp"):
+        rmtree(stale, ignore_errors=True)
+    tmp = data_path / f".{dir.name}.{os.getpid()}.tmp"
+    if tmp.exists():
+        rmtree(tmp)
+    try:
+        _extract(archive, tmp)
+        [subdir] = list(tmp.iterdir())
+        (subdir / "bin" / "clangd").chmod(0o755)
+        if dir.exists():
+            # Renaming onto a non-empty directory fails, so move the old one away.
+            old = tmp / "old"
+            os.replace(dir, old)
+        os.replace(subdir, dir)
+    finally:
+        rmtree(tmp, ignore_errors=True)
+
+
+def _install_mirrored(archive: Path, dir: Path, log: bool) -> None:
+    """Install clangd at `dir` from an archive in the mirror."""
     if log:
-        print(f"Download clangd to {dir}…", file=sys.stderr)
+        print(f"Install clangd from {archive} to {dir}…", file=sys.stderr)
+    # A checksum file created by `sha256sum` can be placed next to the archive.
+    sha_path = archive.with_name(f"{archive.name}.sha256")
+    _verify(archive, sha_path.read_text().split()[0] if sha_path.exists() else None)
+    _install(archive, dir)
 
-    if verch is not None:
-        rmtree(data_path / f"clangd-{verch.version}")
-    if dir.exists():
-        rmtree(dir)
 
-    assets = release.assets
+def _install_release(release: "GitRelease", dir: Path, log: bool) -> None:
+    """Download clangd from a GitHub release and install it at `dir`."""
+    if log:
+        print(f"Download clangd to {dir}…", file=sys.stderr)
     system_prefix = _system_prefix()
-    [asset] = [asset for asset in assets if asset.name.startswith(system_prefix)]
-    data = requests.get(asset.browser_download_url).content
+    [asset] = [a for a in release.assets if a.name.startswith(system_prefix)]
+    downloads = data_path / "downloads"
+    downloads.mkdir(exist_ok=True)
+    archive = downloads / asset.name
+    # Only recent PyGithub releases provide the digest of an asset.
+    digest: str | None = getattr(asset, "digest", None)
+    _download(
+        asset.browser_download_url,
+        archive,
+        digest.removeprefix("sha256:") if digest is not None else None,
+        asset.size,
+    )
+    _install(archive, dir)
+    archive.unlink()
 
-    zip = zipfile.ZipFile(BytesIO(data))
-    zip.extractall(dir)
-    [subdir] = list(dir.iterdir())
-    for p in subdir.iterdir():
-        p.rename(dir / p.relative_to(subdir))
-    subdir.rmdir()
 
+def _update(verch: VersionCheck | None, log: bool) -> Path:
+    """Install the latest clangd release unless it is already installed.
+
+    The release is taken from the mirror if one is set and from GitHub otherwise.
+    The caller needs to hold the lock named “clangd”.
+
+    Args:
+        verch: The installed version, if any, which is kept after an update for
+            running servers, while even older versions are removed.
+        log: Whether to log the LSP state.
+    """
+    install: Callable[[Path, bool], None]
+    if (mirrored := _mirror_archive()) is not None:
+        version, archive = mirrored
+        install = partial(_install_mirrored, archive)
+    else:
+        release = github().get_repo("clangd/clangd").get_latest_release()
+        version = release.name
+        install = partial(_install_release, release)
+    dir = data_path / f"clangd-{version}"
+    if verch is not None and verch.version == version:
+        if log:
+            print("clangd version checked and up to date!", file=sys.stderr)
+        update_version("clangd", version)
+        return dir
+
+    install(dir, log)
     update_version("clangd", version)
+    keep = [dir] if verch is None else [dir, data_path / f"clangd-{verch.version}"]
+    prune_installs("clangd-*", keep)
 
     return dir
 
 
+def _get_dir(log: bool) -> Path:
+    """Determine the path to store clangd at, optionally logging the LSP state.
+
+    An installed clangd is returned immediately and checked for updates once a day,
+    which long-lived processes do in the background. Only a missing clangd is
+    downloaded before returning.
+    """
+    verch = version_check("clangd")
+    if verch is not None and (dir := data_path / f"clangd-{verch.version}").exists():
+        if verch.check and not is_offline():
+            if log:
+                print("Checking for clangd updates…", file=sys.stderr)
+            check_for_updates("clangd", lambda: _update(verch, log), log)
+        elif log:
+            print("clangd is up to date!", file=sys.stderr)
+        return dir
+
+    if is_offline() and mirror_env not in os.environ:
+        raise RuntimeError(f"clangd is not installed, but {offline_env} is set!")
+    # Only one process installs clangd, while the others wait and use its result.
+    with lock("clangd"):
+        verch = version_check("clangd")
+        if (
+            verch is not None
+            and (dir := data_path / f"clangd-{verch.version}").exists()
+        ):
+            return dir
+        return _update(verch, log)
+
+
+# The last path returned by `get_clangd_path`, which is re-used while it exists
+_clangd_path: Path | None = None
+
+
 def get_clangd_path(log: bool) -> Path:
-    """Get the path of the clangd executable, optionally logging the LSP state."""
+    """Get the path of the clangd executable, optionally logging the LSP state.
+
+    Once the path has been determined, later calls in the same process only check
+    that it still exists.
+    """
+    global _clangd_path
+    if _clangd_path is not None and _clangd_path.exists():
+        return _clangd_path
     lsp = _get_dir(log=log) / "bin" / "clangd"
     assert lsp.exists()
-    lsp.chmod(0o755)
+    _clangd_path = lsp
     return lsp
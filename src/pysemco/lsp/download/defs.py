@@ -1,79 +1,32 @@
-import json
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from collections.abc import Collection
+from pathlib import Path
+from shutil import rmtree
+from typing import TYPE_CHECKING
 
-from github import Github
-from platformdirs import user_data_path
+from pysemco.state import data_path
 
-from pysemco.serialization import deserialize, serialize
+if TYPE_CHECKING:
+    from github import Github
 
 
-@dataclass
-class LspInfo:
-    """The version of an LSP and the last time it was checked."""
-
-    version: str
-    last_check: datetime
-
-
-LspInfos = dict[str, LspInfo]
-
-
-@dataclass
-class VersionCheck:
-    """The version of an LSP and whether it should be checked."""
-
-    version: str
-    check: bool
-
-
-# The path at which pysemco’s LSPs and other data is stored
-data_path = user_data_path() / "pysemco"
-data_path.mkdir(exist_ok=True)
-
-# The path of the state file
-_state_path = data_path / "state.json"
-
-
-def _get_state() -> LspInfos | None:
-    """The currently stored LSP state, or None if none has been stored yet."""
-    if _state_path.exists():
-        with open(_state_path, "r") as f:
-            return deserialize(json.load(f), LspInfos)
-
-
-def version_check(name: str) -> VersionCheck | None:
-    """Determine the version of a stored LSP and whether to check if it is up to date.
+def github() -> "Github":
+    """Create a new GitHub instance."""
+    from github import Github
 
-    Args:
-        name: The name of the language server.
+    return Github()
 
-    Returns:
-        The stored version and whether to check it, or None if none is stored.
-    """
-    state = _get_state()
-    if state is not None and (info := state.get(name)) is not None:
-        return VersionCheck(
-            version=info.version,
-            check=(datetime.now() - info.last_check) > timedelta(days=1),
-        )
 
+def prune_installs(pattern: str, keep: Collection[Path]) -> None:
+    """Remove the installations of an LSP in `data_path` except for the given ones.
 
-def update_version(name: str, version: str) -> None:
-    """Update the stored version of a given LSP.
+    Language servers that are still running may use the installation they were
+    started from, so the caller keeps the previous version next to the current one
+    and only older versions are removed. The caller needs to hold the LSP’s lock.
 
     Args:
-        name: The name of the LSP.
-        version: The new version of the LSP.
+        pattern: The glob pattern matching the installation directories.
+        keep: The installation directories to keep.
     """
-    state = _get_state()
-    if state is None:
-        state = {}
-    state[name] = LspInfo(version, datetime.now())
-    with open(_state_path, "w") as f:
-        json.dump(serialize(state), f, indent=2)
-
-
-def github() -> Github:
-    """Create a new GitHub instance."""
-    return Github()
+    for path in data_path.glob(pattern):
+        if path.is_dir() and path not in keep:
+            rmtree(path, ignore_errors=True)
@@ -1,55 +1,210 @@
+import os
+import re
 from pathlib import Path
 import subprocess
 import sys
 from shutil import rmtree
 
-from pysemco.lsp.download.defs import data_path, update_version, version_check
+from pysemco.lsp.download.defs import prune_installs
+from pysemco.state import (
+    VersionCheck,
+    check_for_updates,
+    data_path,
+    is_offline,
+    lock,
+    offline_env,
+    update_version,
+    version_check,
+)
 
 
-def _get_version(python: Path):
-    version_prog = "import importlib.metadata as m; print(m.version('basedpyright'))"
-    version = subprocess.run(
-        [python, "-c", version_prog],
-        check=True,
-        stdout=subprocess.PIPE,
-    )
-    return version.stdout.decode().strip()
+def _get_version(pyr_path: Path) -> str:
+    """The installed version of basedpyright, read from its metadata in the venv."""
+    from importlib.metadata import distributions
 
+    sites = [
+        *pyr_path.glob("lib/python*/site-packages"),
+        pyr_path / "Lib" / "site-packages",
+    ]
+    for site in sites:
+        for dist in distributions(name="basedpyright", path=[str(site)]):
+            return dist.version
+    raise RuntimeError(f"basedpyright is not installed in {pyr_path}!")
 
-def _get_dir(log: bool):
-    """Determine the path to store pyright at, optionally logging the LSP state."""
 
-    pyr_path = data_path / "basedpyright"
+def _marker(pyr_path: Path) -> Path:
+    """The file marking a complete installation in the venv at `pyr_path`."""
+    return pyr_path / ".pysemco-complete"
 
-    verch = version_check("basedpyright")
-    if verch is not None and not verch.check:
-        if log:
-            print("basedpyright is up to date!", file=sys.stderr)
+
+# The venv of basedpyright installed by earlier versions of pysemco, which is used
+# until the next update
+_legacy_path = data_path / "basedpyright"
+
+
+def _venv_path(version: str) -> Path:
+    """The path of the venv containing the given version of basedpyright."""
+    return data_path / f"basedpyright-{version}"
+
+
+def _installed(verch: VersionCheck | None) -> Path | None:
+    """The complete venv of the stored version of basedpyright, if there is one."""
+    if verch is not None and _marker(pyr_path := _venv_path(verch.version)).exists():
         return pyr_path
+    if _marker(_legacy_path).exists():
+        return _legacy_path
+    return None
+
+
+def _latest_version(python: Path) -> str | None:
+    """The latest version of basedpyright on the index configured for pip.
+
+    Returns:
+        The version, or None if pip cannot tell, e.g. because `python` has no pip
+        or its pip does not support `pip index`.
+    """
+    try:
+        result = subprocess.run(
+            [python, "-m", "pip", "index", "versions", "basedpyright"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = re.match(r"basedpyright \(([^)]+)\)", result.stdout)
+    return None if match is None else match[1]
+
+
+def _relocate(venv: Path, dst: Path) -> None:
+    """Make the scripts of the venv at `venv` refer to `dst` before it is moved there.
+
+    pip writes the absolute path of the venv’s Python into the scripts it installs.
+    """
+    old, new = str(venv).encode(), str(dst).encode()
+    for script in (venv / "bin").iterdir():
+        if script.is_file() and not script.is_symlink():
+            data = script.read_bytes()
+            if old in data:
+                script.write_bytes(data.replace(old, new))
+
+
+def _install(version: str | None) -> Path:
+    """Install basedpyright into a venv of its own, named after its version.
 
-    python = pyr_path / "bin" / "python3"
-    if not python.exists():
-        if pyr_path.exists():
-            rmtree(pyr_path)
-        subprocess.run([sys.executable, "-m", "venv", pyr_path], check=True)
-        subprocess.run([python, "-m", "pip", "install", "basedpyright"], check=True)
-        update_version("basedpyright", _get_version(python))
+    The venv is built in a temporary directory and only renamed into place once it
+    is complete. The caller needs to hold the lock named “basedpyright”.
+
+    Args:
+        version: The version to install, by default the one pip considers the latest.
+
+    Returns:
+        The path of the venv.
+    """
+    # Temporary venvs of other processes are left over from interrupted installs.
+    for stale in data_path.glob(".basedpyright.*.tmp"):
+        rmtree(stale, ignore_errors=True)
+    tmp = data_path / f".basedpyright.{os.getpid()}.tmp"
+    try:
+        python = tmp / "bin" / "python3"
+        subprocess.run([sys.executable, "-m", "venv", tmp], check=True)
+        requirement = "basedpyright" if version is None else f"basedpyright=={version}"
+        subprocess.run([python, "-m", "pip", "install", requirement], check=True)
+        pyr_path = _venv_path(_get_version(tmp))
+        if not _marker(pyr_path).exists():
+            _relocate(tmp, pyr_path)
+            _marker(tmp).touch()
+            if pyr_path.exists():
+                rmtree(pyr_path)
+            os.replace(tmp, pyr_path)
         return pyr_path
+    finally:
+        rmtree(tmp, ignore_errors=True)
+
+
+def _update(verch: VersionCheck | None, log: bool) -> Path:
+    """Install the latest basedpyright release unless it is already installed.
 
-    if verch is not None and verch.version == _get_version(python):
+    The caller needs to hold the lock named “basedpyright”.
+
+    Args:
+        verch: The installed version, if any, which is kept after an update for
+            running servers, while even older versions are removed.
+        log: Whether to log the LSP state.
+    """
+    previous = _installed(verch)
+    # Without an installed venv, the pip of this interpreter is asked, if it has one.
+    python = Path(sys.executable) if previous is None else previous / "bin" / "python3"
+    version = _latest_version(python)
+    if previous is not None and verch is not None and verch.version == version:
         if log:
             print("basedpyright version checked and up to date!", file=sys.stderr)
-        return pyr_path
+        update_version("basedpyright", verch.version)
+        return previous
 
-    subprocess.run(
-        [python, "-m", "pip", "install", "--upgrade", "basedpyright"], check=True
+    if log:
+        print("Install basedpyright…", file=sys.stderr)
+    pyr_path = _install(version)
+    update_version("basedpyright", _get_version(pyr_path))
+    prune_installs(
+        "basedpyright*", [pyr_path] if previous is None else [pyr_path, previous]
     )
-    update_version("basedpyright", _get_version(python))
     return pyr_path
 
 
+def _get_dir(log: bool) -> Path:
+    """Determine the path to store pyright at, optionally logging the LSP state.
+
+    An installed basedpyright is returned immediately and checked for updates once
+    a day, which long-lived processes do in the background. Only a missing
+    basedpyright is installed before returning, by one process while the others
+    wait for it.
+    """
+    verch = version_check("basedpyright")
+    if (pyr_path := _installed(verch)) is not None:
+        if verch is not None and verch.check and not is_offline():
+            if log:
+                print("Checking for basedpyright updates…", file=sys.stderr)
+            check_for_updates("basedpyright", lambda: _update(verch, log), log)
+        elif log:
+            print("basedpyright is up to date!", file=sys.stderr)
+        return pyr_path
+
+    with lock("basedpyright"):
+        verch = version_check("basedpyright")
+        if (pyr_path := _installed(verch)) is not None:
+            return pyr_path
+        if (_legacy_path / "bin" / "basedpyright-langserver").exists():
+            try:
+                version = _get_version(_legacy_path)
+            except RuntimeError:
+                version = None
+            if version is not None:
+                # A complete installation by an earlier version without a marker
+                _marker(_legacy_path).touch()
+                update_version("basedpyright", version)
+                return _legacy_path
+        if is_offline():
+            raise RuntimeError(
+                f"basedpyright is not installed, but {offline_env} is set!"
+            )
+        return _update(verch, log)
+
+
+# The last path returned by `get_pyright_path`, which is re-used while it exists
+_pyright_path: Path | None = None
+
+
 def get_pyright_path(log: bool):
-    """Get the path of the pyright executable, optionally logging the LSP state."""
+    """Get the path of the pyright executable, optionally logging the LSP state.
+
+    Once the path has been determined, later calls in the same process only check
+    that it still exists.
+    """
+    global _pyright_path
+    if _pyright_path is not None and _pyright_path.exists():
+        return _pyright_path
     lsp = _get_dir(log) / "bin" / "basedpyright-langserver"
     assert lsp.exists()
+    _pyright_path = lsp
     return lsp
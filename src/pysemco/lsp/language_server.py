@@ -1,95 +1,286 @@
+import asyncio
 import logging
-from collections.abc import Generator
-from contextlib import contextmanager
-from pathlib import Path, PurePath
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
 
 from multilspy.language_server import FileUtils
 from multilspy.language_server import LanguageServer as _LanguageServer
-from multilspy.language_server import LSPConstants, LSPFileBuffer, MultilspyException
-from multilspy.lsp_protocol_handler.lsp_types import SemanticTokens
+from multilspy.language_server import MultilspyException
+from multilspy.lsp_protocol_handler.lsp_types import (
+    Position,
+    SemanticTokens,
+    SemanticTokensEdit,
+    TextDocumentContentChangeEvent,
+)
+
+
+@dataclass
+class _Document:
+    """A document kept open in the language server across requests."""
+
+    version: int
+    text: str
+    # The ID and data of the last semantic tokens if the server can send deltas to them
+    result_id: str | None = None
+    data: list[int] = field(default_factory=list)
+    # Held while the document is changed and its tokens are requested
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # The number of requests using the document, which keep it from being closed
+    users: int = 0
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """The length of the common prefix of two strings, compared in blocks."""
+    n, i, block = min(len(a), len(b)), 0, 4096
+    while i + block <= n and a[i : i + block] == b[i : i + block]:
+        i += block
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _position(text: str, offset: int) -> Position:
+    """The LSP position of a string offset, whose column is counted in UTF-16 units."""
+    line_start = text.rfind("\n", 0, offset) + 1
+    character = len(text[line_start:offset].encode("utf-16-le")) // 2
+    return {"line": text.count("\n", 0, offset), "character": character}
+
+
+def text_change(old: str, new: str) -> TextDocumentContentChangeEvent:
+    """An incremental change turning `old` into `new`.
+
+    The change replaces the part between the common prefix and suffix of the texts,
+    which covers a single edit exactly.
+    """
+    prefix = _common_prefix(old, new)
+    limit = min(len(old), len(new)) - prefix
+    suffix = min(_common_prefix(old[::-1], new[::-1]), limit)
+    return {
+        "range": {
+            "start": _position(old, prefix),
+            "end": _position(old, len(old) - suffix),
+        },
+        "text": new[prefix : len(new) - suffix],
+    }
+
+
+def apply_semantic_token_edits(
+    data: Sequence[int],
+    edits: list[SemanticTokensEdit],
+) -> list[int]:
+    """Apply the edits of a semantic token delta to the previous `data` array.
+
+    The edits refer to positions in the previous array and do not overlap.
+    """
+    out: list[int] = []
+    pos = 0
+    for edit in sorted(edits, key=lambda e: e["start"]):
+        out.extend(data[pos : edit["start"]])
+        out.extend(edit.get("data", []))
+        pos = edit["start"] + edit["deleteCount"]
+    out.extend(data[pos:])
+    return out
+
+
+# The number of seconds to wait for a server to acknowledge a shutdown request
+shutdown_timeout = 5.0
+# The number of documents kept open in a server, beyond which the least recently
+# used ones are closed, as servers like clangd keep an AST for each open document
+max_open_documents = 16
 
 
 class LanguageServer(_LanguageServer):
-    @contextmanager
-    def open_file(
-        self,
-        relative_file_path: str,
-        contents: str | None = None,
-    ) -> Generator[None]:
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # The documents kept open by `semantic_tokens`, keyed by their URI and ordered
+        # from the least to the most recently used one
+        self.documents: OrderedDict[str, _Document] = OrderedDict()
+
+    def is_running(self) -> bool:
+        """Whether the server process has been started and is still running.
+
+        The process is looked up directly, as asyncio only notices that it has exited
+        while the event loop is running, which is not the case between `run_sync` calls.
         """
-        Open a file in the Language Server.
-        This is required before making any requests to the Language Server.
-        This version is extended to support custom file contents.
+        import psutil
+
+        process = self.server.process
+        if process is None or process.returncode is not None:
+            return False
+        try:
+            return psutil.Process(process.pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
 
-        :param relative_file_path: The relative path of the file to open.
+    def _capabilities(self) -> dict[str, Any]:
+        """The capabilities of the running server."""
+        resp = getattr(self, "init_response", None)
+        assert resp is not None
+        return resp["capabilities"]  # type: ignore
+
+    def _sync_kind(self) -> int:
+        """How the server is kept up to date with changes (0: none, 1: full, 2: incremental)."""
+        sync = self._capabilities().get("textDocumentSync", 0)
+        return sync if isinstance(sync, int) else sync.get("change", 0)
+
+    def _supports_delta(self) -> bool:
+        """Whether the server can send the difference to earlier semantic tokens."""
+        full = self._capabilities()["semanticTokensProvider"].get("full", False)
+        return isinstance(full, dict) and bool(full.get("delta", False))
+
+    def _send_open(self, uri: str, doc: _Document) -> None:
+        """Notify the server that a document has been opened."""
+        self.server.notify.did_open_text_document(
+            {
+                "textDocument": {
+                    "uri": uri,
+                    "languageId": self.language_id,
+                    "version": doc.version,
+                    "text": doc.text,
+                }
+            }
+        )
+
+    def _change_document(self, uri: str, doc: _Document, contents: str) -> None:
+        """Update the contents of an open document, sending only the changed part."""
+        change: TextDocumentContentChangeEvent
+        match self._sync_kind():
+            case 2:
+                change = text_change(doc.text, contents)
+            case 1:
+                change = {"text": contents}
+            case _:
+                # The server does not support changes, so the document is reopened.
+                self.server.notify.did_close_text_document(
+                    {"textDocument": {"uri": uri}}
+                )
+                doc.version, doc.text = 0, contents
+                doc.result_id, doc.data = None, []
+                self._send_open(uri, doc)
+                return
+        doc.version += 1
+        doc.text = contents
+        self.server.notify.did_change_text_document(
+            {
+                "textDocument": {"uri": uri, "version": doc.version},
+                "contentChanges": [change],
+            }
+        )
+
+    def _close_documents(self) -> None:
+        """Close the least recently used documents beyond `max_open_documents`.
+
+        Documents that are used by a request are kept open.
+        """
+        excess = len(self.documents) - max_open_documents
+        if excess <= 0:
+            return
+        unused = [uri for uri, doc in self.documents.items() if doc.users == 0]
+        for uri in unused[:excess]:
+            del self.documents[uri]
+            self.server.notify.did_close_text_document({"textDocument": {"uri": uri}})
+
+    def _supports_range(self) -> bool:
+        """Whether the server can compute semantic tokens for a range."""
+        provider = self._capabilities()["semanticTokensProvider"]
+        return bool(provider.get("range", False))
+
+    @asynccontextmanager
+    async def _document(
+        self, file: Path, contents: str | None
+    ) -> AsyncGenerator[tuple[str, _Document]]:
+        """Provide the URI and state of a file with the given contents.
+
+        The file is opened if necessary and its document is locked and kept open
+        while it is used. If no contents are given, they are read from the file.
         """
         if not self.server_started:
             self.logger.log(
-                "open_file called before Language Server started",
+                "semantic_tokens called before Language Server started",
                 logging.ERROR,
             )
             raise MultilspyException("Language Server not started")
 
-        absolute_file_path = str(
-            PurePath(self.repository_root_path, relative_file_path)
-        )
-        uri = Path(absolute_file_path).as_uri()
-
-        if uri in self.open_file_buffers:
-            assert self.open_file_buffers[uri].uri == uri
-            assert self.open_file_buffers[uri].ref_count >= 1
-
-            self.open_file_buffers[uri].ref_count += 1
-            yield
-            self.open_file_buffers[uri].ref_count -= 1
+        if contents is None:
+            contents = FileUtils.read_file(self.logger, str(file))
+        uri = file.as_uri()
+        if (doc := self.documents.get(uri)) is None:
+            doc = _Document(0, contents)
+            self.documents[uri] = doc
+            self._send_open(uri, doc)
         else:
-            if contents is None:
-                contents = FileUtils.read_file(self.logger, absolute_file_path)
+            self.documents.move_to_end(uri)
 
-            version = 0
-            self.open_file_buffers[uri] = LSPFileBuffer(
-                uri, contents, version, self.language_id, 1
-            )
+        doc.users += 1
+        try:
+            async with doc.lock:
+                if doc.text != contents:
+                    self._change_document(uri, doc, contents)
+                yield uri, doc
+        finally:
+            doc.users -= 1
+            self._close_documents()
 
-            self.server.notify.did_open_text_document(
-                {
-                    LSPConstants.TEXT_DOCUMENT: {
-                        LSPConstants.URI: uri,
-                        LSPConstants.LANGUAGE_ID: self.language_id,
-                        LSPConstants.VERSION: 0,
-                        LSPConstants.TEXT: contents,
-                    }
-                }
-            )
-            yield
-            self.open_file_buffers[uri].ref_count -= 1
+    async def semantic_tokens(
+        self,
+        file: Path,
+        contents: str | None = None,
+    ) -> SemanticTokens | None:
+        """Compute semantic tokens for the given file.
 
-        if self.open_file_buffers[uri].ref_count == 0:
-            self.server.notify.did_close_text_document(
-                {
-                    LSPConstants.TEXT_DOCUMENT: {
-                        LSPConstants.URI: uri,
-                    }
-                }
-            )
-            del self.open_file_buffers[uri]
+        The file is kept open, so that later requests for it only send the part
+        of the contents that has changed. If the server supports it, these requests
+        also only receive the difference to the preceding tokens, which is applied
+        to them to form the returned tokens.
+        """
+        async with self._document(file, contents) as (uri, doc):
+            if doc.result_id is not None:
+                result = await self.server.send.semantic_tokens_delta(
+                    {"textDocument": {"uri": uri}, "previousResultId": doc.result_id}
+                )
+            else:
+                result = await self.server.send.semantic_tokens_full(
+                    {"textDocument": {"uri": uri}}
+                )
+            if result is None:
+                doc.result_id = None
+                return None
 
-    async def semantic_tokens(
+            if "edits" in result:
+                data = apply_semantic_token_edits(doc.data, result["edits"])
+            else:
+                data = result["data"]
+            if self._supports_delta() and "resultId" in result:
+                doc.result_id, doc.data = result["resultId"], data
+            return {"data": data}
+
+    async def semantic_tokens_range(
         self,
         file: Path,
+        begin: int,
+        end: int,
         contents: str | None = None,
     ) -> SemanticTokens | None:
-        """Compute and convert semantic tokens for the given file."""
+        """Compute semantic tokens for the lines `begin` to `end` (exclusive) of a file.
 
-        if not self.server_started:
-            self.logger.log(
-                "semantic_tokens called before Language Server started",
-                logging.ERROR,
-            )
-            raise MultilspyException("Language Server not started")
+        The file is kept open as in `semantic_tokens`. If the server does not support
+        range requests, the tokens of the whole file are computed instead, i.e. the
+        result can contain tokens outside of the range in any case.
+        """
+        if not self._supports_range():
+            return await self.semantic_tokens(file, contents)
 
-        relative_file_path = str(file.relative_to(self.repository_root_path))
-        with self.open_file(relative_file_path, contents):
-            return await self.server.send.semantic_tokens_full(
-                {"textDocument": {"uri": file.as_uri()}}
+        async with self._document(file, contents) as (uri, doc):
+            return await self.server.send.semantic_tokens_range(
+                {
+                    "textDocument": {"uri": uri},
+                    "range": {
+                        "start": {"line": begin, "character": 0},
+                        "end": {"line": end, "character": 0},
+                    },
+                }
             )
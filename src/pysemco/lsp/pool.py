@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import final
+
+from .language_server import LanguageServer
+
+PoolKey = tuple[str, Path]
+
+
+@dataclass
+class _PoolEntry:
+    """A running language server together with its bookkeeping."""
+
+    server: LanguageServer
+    stack: AsyncExitStack
+    # The number of sessions currently using the server
+    users: int = 0
+    # The time at which the last session ended
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def _create_server(lang: str, root: Path, log_lsp: bool) -> LanguageServer:
+    """Create a language server for the given language without starting it."""
+    from multilspy.multilspy_logger import MultilspyLogger
+
+    match lang:
+        case "cpp":
+            from .clangd import ClangdServer
+
+            return ClangdServer(MultilspyLogger(), root, log_lsp=log_lsp)
+        case "python":
+            from .pyright import PyrightServer
+
+            return PyrightServer(MultilspyLogger(), root, log_lsp=log_lsp)
+        case _:
+            raise Exception(f"No language server for language {lang!r}!")
+
+
+@final
+class LanguageServerPool:
+    """Language servers that are kept running across requests.
+
+    The servers are keyed by language and workspace root, which avoids starting
+    (and initializing) a new server for each file. This is especially relevant for
+    clangd, which would otherwise lose its index and compiled preambles.
+    Servers that have not been used for `idle_timeout` seconds are shut down
+    the next time the pool is used, and servers that have exited are replaced
+    by new ones.
+
+    The servers are bound to the event loop they have been started in.
+    If the pool is used from a different event loop, the old servers are killed.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0):
+        self.idle_timeout = idle_timeout
+        self._entries: dict[PoolKey, _PoolEntry] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock: asyncio.Lock | None = None
+
+    def _check_loop(self) -> asyncio.Lock:
+        """Reset the pool if it is used from a new event loop and return its lock."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._lock is None:
+            for entry in self._entries.values():
+                try:
+                    entry.server.server.process.kill()  # pyright: ignore
+                except Exception:
+                    pass
+            self._entries.clear()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _stop(self, key: PoolKey) -> None:
+        """Shut down the server with the given key."""
+        entry = self._entries.pop(key)
+        try:
+            await entry.stack.aclose()
+        except Exception as exc:
+            entry.server.logger.log(
+                f"Error while stopping pooled LSP server: {exc}", logging.WARNING
+            )
+
+    async def evict_idle(self) -> None:
+        """Shut down all servers that have been idle for longer than the timeout."""
+        now = time.monotonic()
+        idle = [
+            key
+            for key, entry in self._entries.items()
+            if entry.users == 0 and now - entry.last_used > self.idle_timeout
+        ]
+        for key in idle:
+            await self._stop(key)
+
+    @asynccontextmanager
+    async def session(
+        self,
+        lang: str,
+        root: Path,
+        log_lsp: bool = False,
+    ) -> AsyncGenerator[LanguageServer]:
+        """Provide a started language server for the given language and root.
+
+        Args:
+            lang: The language to provide a server for.
+            root: The root directory of the workspace.
+            log_lsp: Whether to log the language server’s state when creating it.
+        """
+        lock = self._check_loop()
+        key = (lang, root.resolve())
+
+        async with lock:
+            await self.evict_idle()
+            entry = self._entries.get(key)
+            if entry is not None and not entry.server.is_running():
+                entry.server.logger.log(
+                    f"Restarting the {lang} language server, which has exited",
+                    logging.WARNING,
+                )
+                await self._stop(key)
+                entry = None
+            if entry is None:
+                server = _create_server(lang, key[1], log_lsp)
+                stack = AsyncExitStack()
+                await stack.enter_async_context(server.start_server())
+                entry = _PoolEntry(server, stack)
+                self._entries[key] = entry
+            entry.users += 1
+
+        try:
+            yield entry.server
+        finally:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        """Shut down all servers in the pool."""
+        if self._loop is not asyncio.get_running_loop():
+            self._check_loop()
+            return
+        for key in list(self._entries):
+            await self._stop(key)
+
+
+_default_pool: LanguageServerPool | None = None
+
+
+def default_pool() -> LanguageServerPool:
+    """The pool shared by all token computations that do not provide their own."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = LanguageServerPool()
+    return _default_pool
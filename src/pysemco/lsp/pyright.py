@@ -1,7 +1,9 @@
+import asyncio
 import json
 import logging
 import os
 import shlex
+import sys
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from importlib.resources import files
@@ -14,12 +16,72 @@ from multilspy.lsp_protocol_handler.server import ProcessLaunchInfo
 from multilspy.multilspy_config import MultilspyConfig
 from multilspy.multilspy_logger import MultilspyLogger
 
+from ..state import workspace_dir, write_atomic
 from ..tokens.defs import StrPath
 from .download.pyright import get_pyright_path
-from .language_server import LanguageServer
+from .language_server import LanguageServer, shutdown_timeout
+
+# The environment variable enabling scoped workspaces if set to a non-empty value
+scoped_env = "PYSEMCO_PYRIGHT_SCOPED"
+# The environment variable setting the venv that imports are resolved in
+venv_env = "PYSEMCO_PYRIGHT_VENV"
+
+
+def _default_venv() -> Path | None:
+    """The venv set by `PYSEMCO_PYRIGHT_VENV`, or the one pysemco runs in if any."""
+    if env_venv := os.environ.get(venv_env):
+        return Path(env_venv)
+    if sys.prefix != sys.base_prefix:
+        return Path(sys.prefix)
+    return None
+
+
+def _prepare_config(root: Path, venv: Path | None) -> Path:
+    """Generate the configuration of a scoped workspace and return its path.
+
+    The configuration lives in a directory of its own, which basedpyright takes as
+    the project root. As this directory contains no Python files, only the open
+    files are analyzed, while the workspace’s modules are found through
+    `extraPaths` instead of a scan of the workspace.
+    """
+    dir = workspace_dir(root) / "basedpyright"
+    dir.mkdir(parents=True, exist_ok=True)
+
+    root = root.resolve()
+    # As with `autoSearchPaths`, a `src` directory also contains top-level modules.
+    extra_paths = [str(p) for p in (root, root / "src") if p.is_dir()]
+    config: dict[str, object] = {"extraPaths": extra_paths}
+    if venv is not None:
+        venv = venv.resolve()
+        config |= {"venvPath": str(venv.parent), "venv": venv.name}
+
+    path = dir / "pyrightconfig.json"
+    contents = json.dumps(config, indent=2)
+    if not path.exists() or path.read_text() != contents:
+        write_atomic(path, contents)
+    return path
 
 
 class PyrightServer(LanguageServer):
+    """basedpyright, optionally restricted to the files it is asked about.
+
+    By default, basedpyright discovers the Python files in the whole workspace
+    before it answers the first request. A scoped workspace instead uses a generated
+    configuration, under which only open files are analyzed and imports are resolved
+    in a fixed venv.
+
+    Args:
+        logger: The logger.
+        root: The root of the workspace.
+        pyright_cmd: The basedpyright executable, which is installed if not given.
+        trace_lsp_communication: Whether to log the messages exchanged with the server.
+        log_lsp: Whether to log the state of the installed basedpyright.
+        scoped: Whether to use a scoped workspace, by default whether the environment
+            variable `PYSEMCO_PYRIGHT_SCOPED` is set.
+        venv: The venv to resolve imports in if the workspace is scoped, by default
+            the value of `PYSEMCO_PYRIGHT_VENV` or the venv pysemco runs in.
+    """
+
     def __init__(
         self,
         logger: MultilspyLogger,
@@ -28,9 +90,17 @@ class PyrightServer(LanguageServer):
         pyright_cmd: StrPath | None = None,
         trace_lsp_communication: bool = False,
         log_lsp: bool,
+        scoped: bool | None = None,
+        venv: Path | None = None,
     ):
         if pyright_cmd is None:
             pyright_cmd = get_pyright_path(log_lsp)
+        if scoped is None:
+            scoped = bool(os.environ.get(scoped_env))
+        # The generated configuration file if the workspace is scoped
+        self.config_path: Path | None = None
+        if scoped:
+            self.config_path = _prepare_config(root, venv or _default_venv())
         super().__init__(
             MultilspyConfig(Language.PYTHON, trace_lsp_communication),
             logger,
@@ -54,11 +124,32 @@ class PyrightServer(LanguageServer):
 
         return d
 
+    def _configuration(self, section: str | None) -> object:
+        """The value of a configuration section requested by a scoped server."""
+        match section:
+            case "basedpyright":
+                return {
+                    "analysis": {
+                        "configFilePath": str(self.config_path),
+                        "diagnosticMode": "openFilesOnly",
+                        "autoSearchPaths": True,
+                    }
+                }
+            case "python":
+                return {}
+            case _:
+                return None
+
     @asynccontextmanager
     async def start_server(self) -> AsyncGenerator["PyrightServer"]:
         async def execute_client_command(params):
             return []
 
+        async def workspace_configuration(params):
+            return [
+                self._configuration(item.get("section")) for item in params["items"]
+            ]
+
         async def noop(params):
             return
 
@@ -69,6 +160,8 @@ class PyrightServer(LanguageServer):
         self.server.on_notification("language/status", noop)
         self.server.on_notification("window/logMessage", window_log_message)
         self.server.on_request("workspace/executeClientCommand", execute_client_command)
+        if self.config_path is not None:
+            self.server.on_request("workspace/configuration", workspace_configuration)
         self.server.on_notification("$/progress", noop)
         self.server.on_notification("textDocument/publishDiagnostics", noop)
         self.server.on_notification("language/actionableNotification", noop)
@@ -91,9 +184,10 @@ class PyrightServer(LanguageServer):
 
             yield self
 
-            # Best-effort shutdown; if the process already exited, ignore it.
+            # Best-effort shutdown, which a server that has exited cannot answer.
             try:
-                await self.server.shutdown()
+                if self.is_running():
+                    await asyncio.wait_for(self.server.shutdown(), shutdown_timeout)
             except Exception as exc:
                 self.logger.log(f"Error during LSP shutdown: {exc}", logging.WARNING)
             try:
@@ -1,14 +1,21 @@
+import sys
 from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator
+from functools import cached_property
 from pathlib import Path
-from typing import Any, NamedTuple
+from typing import TYPE_CHECKING, Any, NamedTuple
 
-from .convert import latex_line_merge, to_latex
+from .convert import iter_latex, iter_latex_line_merge, latex_line_merge, to_latex
 from .tokens import (
     SemanticToken,
     SemanticTokens,
     compute_minimal_tokens,
     compute_tokens_sync,
 )
+from .tokens.index import TokenIndex
+
+if TYPE_CHECKING:
+    from .cache import AnalysisManifest
 
 
 def convert_params(pstr: str) -> Any:
@@ -20,89 +27,338 @@ def convert_params(pstr: str) -> Any:
         return yaml.safe_load(f"{{{pstr}}}")
 
 
-def run_analyze(args: Namespace) -> None:
+def _is_current(dst: Path, txt: str) -> bool:
+    """Whether `dst` contains an earlier analysis of the source code `txt` as JSON."""
     import json
 
+    from .cache import is_json_path
+
+    if not is_json_path(dst) or not dst.exists():
+        return False
+    with open(dst, "r") as f:
+        tokens = SemanticTokens.from_json(json.load(f))
+    return txt == tokens.txt
+
+
+def _reuse_analysis(
+    dst: Path,
+    manifest: "AnalysisManifest",
+    txt: str,
+    lines: tuple[int, int] | None = None,
+) -> str | None:
+    """Re-use an earlier analysis with the given manifest for `dst` if there is one.
+
+    Returns:
+        “0” if `dst` is up to date, “1” if the analysis has been restored
+        from the shared store, and None if the source code needs to be analyzed.
+    """
+    from .cache import adopt_analysis, is_current, manifest_path, restore_analysis
+
+    if is_current(dst, manifest):
+        return "0"
+    if restore_analysis(dst, manifest):
+        return "1"
+    if lines is None and not manifest_path(dst).exists() and _is_current(dst, txt):
+        # An analysis stored without a manifest by an earlier version
+        adopt_analysis(dst, manifest)
+        return "0"
+    return None
+
+
+def _analysis_name(path: Path) -> str:
+    """The name of the analysis at `path` used for the dependencies in the TeX cache.
+
+    The name includes the suffix, so that the analyses `a.json` and `a.tokens`
+    in the same directory have different dependencies.
+    """
+    return path.name
+
+
+def _cache_output(
+    args: Namespace,
+    command: str,
+    arguments: str,
+    out: str,
+    analysis: str | None = None,
+) -> None:
+    """Add an output to the TeX cache if one has been requested.
+
+    Args:
+        args: The arguments, which contain the cache directory and the key.
+        command: The LaTeX command that stores the output.
+        arguments: The arguments of the command identifying the output.
+        out: The output.
+        analysis: The name of the analysis the output is derived from, if any.
+    """
+    from .cache import TexCache, TexCacheEntry
+
+    if args.cache_dir is None:
+        return
+    assert args.cache_key is not None, "A cache key is required to cache the output!"
+    TexCache(args.cache_dir).add(TexCacheEntry(command, arguments, out, analysis))
+
+
+def _analyze(
+    language: str,
+    root: Path,
+    src: Path,
+    dst: Path,
+    lines: tuple[int, int] | None,
+    cache_dir: Path | None,
+) -> str:
+    """Analyze a source file unless an earlier analysis can be re-used.
+
+    Returns:
+        “1” if the analysis at `dst` has changed and “0” otherwise.
+    """
+    from .cache import TexCache, analysis_manifest, save_analysis
+
+    with open(src, "r") as f:
+        txt = f.read()
+
+    manifest = analysis_manifest(language, root, txt, lines)
+    if (status := _reuse_analysis(dst, manifest, txt, lines)) is None:
+        tokens = compute_tokens_sync(
+            language, root, src, txt, log_lsp=True, lines=lines
+        )
+        # The analysis may have installed or updated the language server.
+        manifest = analysis_manifest(language, root, txt, lines)
+        save_analysis(dst, manifest, tokens)
+        status = "1"
+    if status == "1" and cache_dir is not None:
+        # Entries written by earlier versions refer to the analysis by its stem.
+        TexCache(cache_dir).invalidate(_analysis_name(dst), dst.stem)
+    return status
+
+
+def run_analyze(args: Namespace) -> None:
     root: Path = args.root_path.resolve()
     src: Path = args.in_path.resolve()
     dst: Path = args.out_path.resolve()
 
-    def save_tokens(txt: str | None = None) -> None:
-        if txt is None:
-            with open(src, "r") as f:
-                txt = f.read()
+    lines: tuple[int, int] | None = None
+    if args.lines is not None:
+        begin, end = args.lines
+        lines = (begin, end)
+
+    print(_analyze(args.language, root, src, dst, lines, args.cache_dir))
+
+    if args.register is not None:
+        from .watch import WatchEntry, register
 
-        tokens = compute_tokens_sync(args.language, root, src, txt, log_lsp=True)
-        with open(dst, "w") as f:
-            json.dump(tokens.json, f)
-        print("1")
+        entry = WatchEntry(args.language, root, src, dst, list(lines or []))
+        register(args.register, entry)
 
-    if dst.exists():
+
+def run_analyze_batch(args: Namespace) -> None:
+    from .cache import analysis_manifest, save_analysis
+    from .tokens import compute_tokens_many
+    from .tokens.compute import run_sync
+
+    root: Path = args.root_path.resolve()
+    out_dir: Path = args.out_dir.resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def dst_path(src: Path) -> Path:
+        suffix = ".json" if args.json else ".tokens"
+        dst = out_dir / f"{src.relative_to(root)}{suffix}"
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        return dst
+
+    todo: list[Path] = []
+    for src in args.in_paths:
+        src = src.resolve()
         with open(src, "r") as f:
             txt = f.read()
-        with open(dst, "r") as f:
-            tokens = SemanticTokens.from_json(json.load(f))
-        if txt != tokens.txt:
-            save_tokens(txt)
+        manifest = analysis_manifest(args.language, root, txt)
+        if (status := _reuse_analysis(dst_path(src), manifest, txt)) is not None:
+            print(f"{status} {src}")
         else:
-            print("0")
-    else:
-        save_tokens()
+            todo.append(src)
 
+    async def analyze() -> None:
+        files = compute_tokens_many(args.language, root, todo, log_lsp=True)
+        async for src, tokens in files:
+            manifest = analysis_manifest(args.language, root, tokens.txt)
+            save_analysis(dst_path(src), manifest, tokens)
+            print(f"1 {src}")
+
+    if len(todo) > 0:
+        run_sync(analyze())
+
+
+class _Analysis:
+    """A stored analysis whose tokens and index are loaded when first needed.
+
+    Analyses in the binary format are memory-mapped, so that ranges of lines can be
+    loaded without the rest of the analysis.
+    """
+
+    def __init__(self, path: Path):
+        from .tokens.binary import TokenFile, is_binary_tokens
+
+        self.path = path
+        self.file = TokenFile(path) if is_binary_tokens(path) else None
+
+    @cached_property
+    def tokens(self) -> SemanticTokens:
+        import json
+
+        if self.file is not None:
+            return self.file.tokens()
+        with open(self.path, "r") as f:
+            return SemanticTokens.from_json(json.load(f))
+
+    @cached_property
+    def index(self) -> TokenIndex:
+        return TokenIndex(self.tokens)
+
+    @property
+    def num_lines(self) -> int:
+        if self.file is not None:
+            return self.file.num_lines
+        return len(self.tokens.txt.splitlines())
+
+    def line_range(self, begin: int, end: int) -> SemanticTokens:
+        """The code and tokens of the lines `begin` to `end` (exclusive)."""
+        if self.file is not None:
+            return self.file.line_range(begin, end)
+        return self.tokens.line_range(begin, end)
+
+    def close(self) -> None:
+        """Unmap the analysis if it is stored in the binary format."""
+        if self.file is not None:
+            self.file.close()
+
+
+# The analyses loaded so far, keyed by their path, modification time, and size.
+# This allows a server to answer repeated requests without reloading the analysis.
+_analyses: dict[Path, tuple[tuple[int, int], _Analysis]] = {}
+
+
+def _load_analysis(path: Path) -> _Analysis:
+    """Load the analysis stored at `path`, re-using it if it has not changed."""
+    path = path.resolve()
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if (cached := _analyses.get(path)) is not None:
+        if cached[0] == stamp:
+            return cached[1]
+        cached[1].close()
+
+    analysis = _Analysis(path)
+    _analyses[path] = (stamp, analysis)
+    return analysis
+
+
+def run_watch(args: Namespace) -> None:
+    import signal
+    import traceback
+
+    from .state import enable_background_checks
+    from .watch import FileWatcher, read_watch_list
+
+    enable_background_checks()
+
+    watch_list: Path = args.watch_list.resolve()
+    cache_dir: Path | None = args.cache_dir
+    if cache_dir is not None:
+        cache_dir = cache_dir.resolve()
+
+    # Exit normally when terminated, which shuts down the language servers.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    watcher = FileWatcher(interval=args.interval)
+    entries = read_watch_list(watch_list)
+    try:
+        while True:
+            # Files seen for the first time count as changed, which brings
+            # all analyses up to date at the start.
+            changed = watcher.wait([watch_list, *(e.src for e in entries)])
+            if watch_list in changed:
+                entries = read_watch_list(watch_list)
+                changed |= {e.src for e in entries}
+            for entry in entries:
+                if entry.src not in changed:
+                    continue
+                lines = None
+                if len(entry.lines) > 0:
+                    begin, end = entry.lines
+                    lines = (begin, end)
+                try:
+                    status = _analyze(
+                        entry.language,
+                        entry.root,
+                        entry.src,
+                        entry.dst,
+                        lines,
+                        cache_dir,
+                    )
+                    print(f"{status} {entry.dst}", flush=True)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+# The number of lines that `texify` loads and converts at once
+_texify_chunk = 4096
 
-def run_texify(args: Namespace) -> None:
-    import json
 
-    with open(args.in_path, "r") as f:
-        tokens = SemanticTokens.from_json(json.load(f))
+def run_texify(args: Namespace) -> None:
+    analysis = _load_analysis(args.in_path)
 
     params = convert_params(args.params)
     assert isinstance(params, dict)
-    latex_lines = to_latex(SemanticTokens(tokens.txt, tokens.toks))
+    # The ranges of lines to convert, which are only loaded when converting them
+    lines = range(analysis.num_lines)
 
-    def apply_line_range(line_range: list[Any]) -> list[str]:
+    def apply_line_range(line_range: list[Any]) -> list[range]:
         if len(line_range) == 2:
             begin, end = line_range
             if isinstance(begin, int) and isinstance(end, int):
-                return latex_lines[begin:end]
-        lines: list[str] = []
+                return [lines[begin:end]]
+        ranges: list[range] = []
         for r in line_range:
             assert isinstance(r, list) and len(r) == 2
             begin, end = r
             assert isinstance(begin, int) and isinstance(end, int)
-            lines.extend(latex_lines[begin:end])
-        return lines
+            ranges.append(lines[begin:end])
+        return ranges
 
     if (end := params.get("LineEnd")) is not None:
         assert isinstance(end, int)
-        latex_lines = latex_lines[:end]
+        lines = lines[:end]
     if (begin := params.get("LineBegin")) is not None:
         assert isinstance(begin, int)
-        latex_lines = latex_lines[begin:]
+        lines = lines[begin:]
+    ranges = [lines]
     if (line_range := params.get("LineRange")) is not None:
         assert "LineBegin" not in params and "LineEnd" not in params
         assert isinstance(line_range, list)
-        latex_lines = apply_line_range(line_range)
+        ranges = apply_line_range(line_range)
 
-    print(latex_line_merge(latex_lines))
+    def latex_lines() -> Iterator[str]:
+        for r in ranges:
+            # Load long ranges in chunks to bound the memory used.
+            for begin in range(r.start, r.stop, _texify_chunk):
+                end = min(begin + _texify_chunk, r.stop)
+                yield from iter_latex(analysis.line_range(begin, end))
 
+    for part in iter_latex_line_merge(latex_lines()):
+        sys.stdout.write(part)
+    sys.stdout.write("\n")
 
-def run_texify_partial(args: Namespace) -> None:
-    import json
 
-    with open(args.in_path, "r") as f:
-        tokens = SemanticTokens.from_json(json.load(f))
-    lines = tokens.txt.splitlines()
+def run_texify_partial(args: Namespace) -> None:
+    token_index = _load_analysis(args.in_path).index
 
     with open(args.src, "r") as f:
         txt = f.read()
     txt = txt.strip()
-    occs = [
-        (i, j, j + len(txt))
-        for i, l in enumerate(lines)
-        for j in range(len(l))
-        if l[j:].startswith(txt)
-    ]
+    occs = token_index.find(txt)
 
     class TokTup(NamedTuple):
         line: int
@@ -120,19 +376,13 @@ def run_texify_partial(args: Namespace) -> None:
             end,
             [
                 t
-                for t in tokens.toks
-                if t.line == line
-                and t.start >= start
-                and t.end <= end
-                and t.token_type not in ("unknown",)
+                for t in token_index.within(line, start, end)
+                if t.token_type not in ("unknown",)
             ],
             [
                 t.limited(start, end)
-                for t in tokens.toks
-                if t.line == line
-                and t.start < end
-                and t.end > start
-                and t.token_type not in ("unknown",)
+                for t in token_index.overlapping(line, start, end)
+                if t.token_type not in ("unknown",)
             ],
         )
         for line, start, end in occs
@@ -165,6 +415,15 @@ def run_texify_partial(args: Namespace) -> None:
         assert len(outset) == 1, f"Invalid number of variants for {txt}: {outset}"
         (out,) = outset
 
+    _cache_output(
+        args,
+        r"\@semco@store@part@cache",
+        # The LaTeX package refers to the analysis by its stem.
+        ("" if args.index is None else f"[{args.index}]")
+        + f"{{{args.in_path.stem}}}{{{args.cache_key}}}",
+        out,
+        analysis=_analysis_name(args.in_path),
+    )
     print(f"{out}%")
 
 
@@ -172,6 +431,12 @@ def run_texify_minimal(args: Namespace) -> None:
     with open(args.src, "r") as f:
         txt = f.read()
     (out,) = to_latex(SemanticTokens(txt, compute_minimal_tokens(args.language, txt)))
+    _cache_output(
+        args,
+        r"\@semco@store@mini@cache",
+        f"{{{args.language}}}{{{args.cache_key}}}",
+        out,
+    )
     print(f"{out}%")
 
 
@@ -191,7 +456,27 @@ def run_texify_minimal_file(args: Namespace) -> None:
     print(latex_line_merge(latex_lines))
 
 
-def run() -> None:
+def _add_cache_arguments(parser: ArgumentParser, key: bool) -> None:
+    """Add the arguments for maintaining the TeX cache to a subcommand’s parser.
+
+    Args:
+        parser: The subcommand’s parser.
+        key: Whether the subcommand adds outputs, which requires a key.
+    """
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="The directory containing the cache of outputs for LaTeX, i.e. "
+        + "“cache.jsonl” and “.cache”, which LaTeX can input directly.",
+    )
+    if key:
+        parser.add_argument(
+            "--cache-key",
+            help="The key identifying the input in the cache, e.g. a hex dump.",
+        )
+
+
+def _parser() -> ArgumentParser:
     parser = ArgumentParser(
         description="Run the pysemco tools, which can analyze source code "
         + "and convert it to LaTeX SemCo code."
@@ -221,10 +506,84 @@ def run() -> None:
     analyze_parser.add_argument(
         "out_path",
         type=Path,
-        help="The path to store the analysis at. "
-        + "If there is already a file at this path, it is treated as the result of"
-        + "an earlier analysis and, if the stored source code is the same as "
-        + "the contents of the source file, the existing analysis is re-used.",
+        help="The path to store the analysis at. Analyses are stored in a compact "
+        + "binary format unless the path ends in “.json”, in which case they are "
+        + "exported as JSON. If there is already an analysis at this path whose "
+        + "manifest (stored next to it) matches the source code, language, and tool "
+        + "versions, it is re-used. Analyses are also shared between output paths "
+        + "by the hash of their manifest, so that identical code is only analyzed "
+        + "once.",
+    )
+    analyze_parser.add_argument(
+        "--lines",
+        type=int,
+        nargs=2,
+        metavar=("BEGIN", "END"),
+        help="Only analyze the lines from BEGIN to END (exclusive, counted from 0). "
+        + "The analysis then only contains these lines, which are numbered from 0.",
+    )
+    analyze_parser.add_argument(
+        "--register",
+        type=Path,
+        metavar="WATCH_LIST",
+        help="Add the source file to the given watch list, whose files are kept "
+        + "up to date by “watch”.",
+    )
+    _add_cache_arguments(analyze_parser, key=False)
+
+    analyze_batch_parser = subparsers.add_parser(
+        "analyze_batch",
+        aliases=["analyze-batch"],
+        help="Analyze many source files of one project concurrently. "
+        + "For each file, a line with 1 (analyzed) or 0 (re-used) and its path "
+        + "is printed.",
+    )
+    analyze_batch_parser.add_argument(
+        "language",
+        help="The programming language used in the source files.",
+    )
+    analyze_batch_parser.add_argument(
+        "root_path",
+        type=Path,
+        help="The root path of the source files’ project.",
+    )
+    analyze_batch_parser.add_argument(
+        "out_dir",
+        type=Path,
+        help="The directory to store the analyses at. Each analysis is stored at "
+        + "the source file’s path relative to the root with “.tokens” appended. "
+        + "Existing analyses are re-used as in “analyze”.",
+    )
+    analyze_batch_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Export the analyses as JSON with “.json” appended to their paths "
+        + "instead of using the binary format.",
+    )
+    analyze_batch_parser.add_argument(
+        "in_paths",
+        type=Path,
+        nargs="+",
+        help="The source files’ paths, which need to be within the root path.",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Keep the analyses in a watch list up to date by re-analyzing source "
+        + "files when they change, until interrupted. For each analysis, a line "
+        + "with 1 (changed) or 0 (re-used) and its path is printed.",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="The number of seconds between checks if inotify is not available.",
+    )
+    _add_cache_arguments(watch_parser, key=False)
+    watch_parser.add_argument(
+        "watch_list",
+        type=Path,
+        help="The watch list, which is created by “analyze --register”.",
     )
 
     texify_parser = subparsers.add_parser(
@@ -261,6 +620,7 @@ def run() -> None:
         "src",
         help="The file containing the code segment to convert.",
     )
+    _add_cache_arguments(texify_part_parser, key=True)
 
     texify_mini_parser = subparsers.add_parser(
         "texify_minimal",
@@ -274,6 +634,7 @@ def run() -> None:
         "src",
         help="The source file to convert.",
     )
+    _add_cache_arguments(texify_mini_parser, key=True)
 
     texify_mini_file_parser = subparsers.add_parser(
         "texify_minimal_file",
@@ -293,10 +654,36 @@ def run() -> None:
         help="The path to the source code.",
     )
 
-    args = parser.parse_args()
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve the other commands on a Unix socket to avoid per-call "
+        + "startup costs.",
+    )
+    serve_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=600.0,
+        help="The number of seconds without requests after which the server exits.",
+    )
+    serve_parser.add_argument(
+        "socket",
+        type=Path,
+        help="The path of the Unix socket to listen on.",
+    )
+
+    return parser
+
+
+def run(argv: list[str] | None = None) -> None:
+    parser = _parser()
+    args = parser.parse_args(argv)
     match args.cmd:
         case "analyze":
             run_analyze(args)
+        case "analyze_batch" | "analyze-batch":
+            run_analyze_batch(args)
+        case "watch":
+            run_watch(args)
         case "texify":
             run_texify(args)
         case "texify_partial":
@@ -305,6 +692,12 @@ def run() -> None:
             run_texify_minimal(args)
         case "texify_minimal_file":
             run_texify_minimal_file(args)
+        case "serve":
+            from .state import enable_background_checks
+            from .tex_daemon import serve
+
+            enable_background_checks()
+            serve(args.socket, args.idle_timeout, run)
         case _:
             parser.print_help()
 
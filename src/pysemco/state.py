@@ -0,0 +1,235 @@
+import json
+import os
+import sys
+import threading
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from platformdirs import user_data_path
+
+from pysemco.serialization import deserialize, serialize
+
+
+@dataclass
+class LspInfo:
+    """The version of an LSP and the last time it was checked."""
+
+    version: str
+    last_check: datetime
+
+
+LspInfos = dict[str, LspInfo]
+
+
+@dataclass
+class VersionCheck:
+    """The version of an LSP and whether it should be checked."""
+
+    version: str
+    check: bool
+
+
+# The path at which pysemco’s LSPs and other data is stored
+data_path = user_data_path() / "pysemco"
+data_path.mkdir(parents=True, exist_ok=True)
+
+
+def workspace_dir(root: Path) -> Path:
+    """The directory in which pysemco keeps the LSPs’ files for a workspace root.
+
+    It contains clangd’s generated compilation database and background index in
+    `.cache/clangd/index`, and the configuration of scoped basedpyright workspaces
+    in `basedpyright`.
+    """
+    import hashlib
+
+    root = root.resolve()
+    key = hashlib.sha256(str(root).encode()).hexdigest()[:16]
+    return data_path / "workspaces" / f"{root.name}-{key}"
+
+
+# The path of the state file
+_state_path = data_path / "state.json"
+
+
+@contextmanager
+def lock(name: str, wait: bool = True) -> Generator[bool]:
+    """Hold an exclusive lock shared by all pysemco processes of the user.
+
+    The lock is a `flock` on a file in `data_path`, which the operating system
+    releases if the process dies. Without `fcntl` (on Windows), nothing is locked.
+
+    Args:
+        name: The name of the lock, e.g. the LSP to install.
+        wait: Whether to wait until other processes release the lock.
+
+    Yields:
+        Whether the lock has been acquired, which is always the case when waiting.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+
+    with open(data_path / f".{name}.lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def replace_atomic(dst: Path, write: Callable[[Path], object]) -> None:
+    """Atomically replace `dst` with a file created by `write(path)`."""
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_atomic(dst: Path, data: str) -> None:
+    """Atomically write `data` to `dst`."""
+    replace_atomic(dst, lambda path: path.write_text(data))
+
+
+def _get_state() -> LspInfos | None:
+    """The currently stored LSP state, or None if none has been stored yet."""
+    if _state_path.exists():
+        with open(_state_path, "r") as f:
+            return deserialize(json.load(f), LspInfos)
+
+
+def version_check(name: str) -> VersionCheck | None:
+    """Determine the version of a stored LSP and whether to check if it is up to date.
+
+    Args:
+        name: The name of the language server.
+
+    Returns:
+        The stored version and whether to check it, or None if none is stored.
+    """
+    state = _get_state()
+    if state is not None and (info := state.get(name)) is not None:
+        return VersionCheck(
+            version=info.version,
+            check=(datetime.now() - info.last_check) > timedelta(days=1),
+        )
+
+
+def _check_due(name: str) -> bool:
+    """Whether the LSP is installed and should be checked for updates."""
+    return (verch := version_check(name)) is not None and verch.check
+
+
+def update_version(name: str, version: str) -> None:
+    """Update the stored version of a given LSP.
+
+    Args:
+        name: The name of the LSP.
+        version: The new version of the LSP.
+    """
+    # The lock serializes the updates, while readers rely on the atomic replacement.
+    with lock("state"):
+        state = _get_state()
+        if state is None:
+            state = {}
+        state[name] = LspInfo(version, datetime.now())
+        write_atomic(_state_path, json.dumps(serialize(state), indent=2))
+
+
+# The environment variable that disables downloading and updating LSPs if set to
+# anything but “” or “0”, e.g. on build machines without network access
+offline_env = "PYSEMCO_OFFLINE"
+
+
+def is_offline() -> bool:
+    """Whether LSPs must not be downloaded or updated."""
+    return os.environ.get(offline_env, "") not in ("", "0")
+
+
+# Whether update checks run in background threads, which only long-lived processes
+# enable using `enable_background_checks`
+_background = False
+# The number of seconds for which a process waits for its running update checks
+# when it exits
+background_exit_timeout = 60.0
+# The update checks started in background threads, keyed by the LSP’s name
+_background_checks: dict[str, threading.Thread] = {}
+
+
+def _join_background_checks() -> None:
+    """Wait for the running update checks for at most `background_exit_timeout`."""
+    import time
+
+    deadline = time.monotonic() + background_exit_timeout
+    for thread in list(_background_checks.values()):
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+
+def enable_background_checks() -> None:
+    """Run the update checks of LSPs in background threads from now on.
+
+    Only long-lived processes like `pysemco_tex serve` and `pysemco_tex watch`
+    should do so, as a short-lived process would exit during an update, which then
+    has to start over. When the process exits, it waits for the running checks for
+    at most `background_exit_timeout` seconds.
+    """
+    global _background
+    if not _background:
+        _background = True
+        import atexit
+
+        atexit.register(_join_background_checks)
+
+
+def check_for_updates(name: str, check: Callable[[], object], log: bool) -> None:
+    """Run the update check of an LSP, in a background thread if enabled.
+
+    Nothing is done in offline mode or if a check for the LSP is already running,
+    also in another process, which is determined using the lock named after the LSP.
+    Background threads are daemons, so that a check that takes longer than
+    `background_exit_timeout` does not keep the process alive. Exiting during an
+    update is safe, as new versions are prepared in temporary directories and moved
+    into place once complete, and the unfinished check is repeated next time.
+    If the check fails, e.g. because the network is not available, it is only
+    retried a day later.
+
+    Args:
+        name: The name of the LSP.
+        check: The function checking for and installing updates.
+        log: Whether to log a failed check.
+    """
+    if is_offline():
+        return
+    if (thread := _background_checks.get(name)) is not None and thread.is_alive():
+        return
+
+    def run() -> None:
+        try:
+            with lock(name, wait=False) as acquired:
+                # Another process is installing the LSP or has just checked it.
+                if not acquired or not _check_due(name):
+                    return
+                check()
+        except Exception as e:
+            if log:
+                print(f"Checking for {name} updates failed: {e}", file=sys.stderr)
+            if (verch := version_check(name)) is not None:
+                update_version(name, verch.version)
+
+    if not _background:
+        run()
+        return
+    thread = threading.Thread(target=run, name=f"pysemco-{name}-check", daemon=True)
+    _background_checks[name] = thread
+    thread.start()
@@ -0,0 +1,26 @@
+"""The client forwarding `pysemco_tex` commands to a server started by `serve`.
+
+The client only imports `pysemco_tex` if no server is listening, so that forwarding
+a command does not pay for the imports the server avoids. Apart from the package’s
+`__init__`, which imports no third-party libraries, it only depends on the standard
+library through `tex_daemon`.
+"""
+
+import sys
+
+from .tex_daemon import forward
+
+
+def run_client() -> None:
+    """Forward the command line to a running server or run it in-process otherwise."""
+    argv = sys.argv[1:]
+    response = forward(argv)
+    if response is None:
+        from .pysemco_tex import run
+
+        run(argv)
+        return
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    sys.exit(response["code"])
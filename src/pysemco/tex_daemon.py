@@ -0,0 +1,148 @@
+"""A long-running `pysemco_tex` server and the forwarding of commands to it.
+
+Each `pysemco_tex` call from LaTeX otherwise starts a new interpreter and imports
+pygments, yaml, and multilspy before doing a few milliseconds of actual work.
+The server keeps these imports (and anything cached by them) alive. This module
+imports only the standard library, so that the client in `tex_client` starts
+quickly. Importing it still runs the package’s `__init__`, which loads the modules
+of the public API but none of the third-party libraries, as these are only
+imported lazily; modules on the client’s import path have to keep it that way.
+The server is given the command line interface to run, which keeps this module
+independent of `pysemco_tex`.
+"""
+
+import json
+import os
+import socket
+from collections.abc import Callable
+from pathlib import Path
+from socketserver import StreamRequestHandler, UnixStreamServer
+from typing import Any, final, override
+
+# A command line interface, which is called with the arguments without the program name
+Runner = Callable[[list[str]], None]
+
+# The environment variable used to override the client’s socket path
+socket_env = "PYSEMCO_SOCKET"
+# The socket path used by the client if the environment variable is not set
+default_socket = Path(".semco") / "pysemco.sock"
+
+
+def _execute(run: Runner, cwd: str, argv: list[str]) -> dict[str, Any]:
+    """Run a `pysemco_tex` command in-process and capture its output.
+
+    Args:
+        run: The command line interface to run the command with.
+        cwd: The working directory of the client, which relative paths refer to.
+        argv: The command line arguments without the program name.
+    """
+    import traceback
+    from contextlib import redirect_stderr, redirect_stdout
+    from io import StringIO
+
+    out, err = StringIO(), StringIO()
+    code = 0
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            if len(argv) > 0 and argv[0] == "serve":
+                raise Exception("The server cannot be started through the server!")
+            os.chdir(cwd)
+            run(argv)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    return {"code": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+@final
+class _Handler(StreamRequestHandler):
+    """Handle a single request consisting of one JSON line with `cwd` and `argv`."""
+
+    @override
+    def handle(self) -> None:
+        assert isinstance(self.server, _Server)
+        request = json.loads(self.rfile.readline())
+        response = _execute(self.server.run, request["cwd"], request["argv"])
+        self.wfile.write(json.dumps(response).encode())
+
+
+@final
+class _Server(UnixStreamServer):
+    """A Unix socket server that handles requests sequentially until it is idle."""
+
+    def __init__(self, path: Path, idle_timeout: float, run: Runner):
+        super().__init__(str(path), _Handler)
+        self.run = run
+        self.timeout = idle_timeout
+        self.idle = False
+
+    @override
+    def handle_timeout(self) -> None:
+        self.idle = True
+
+
+def _is_listening(path: Path) -> bool:
+    """Whether a server is accepting connections on the given socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def serve(path: Path, idle_timeout: float, run: Runner) -> None:
+    """Serve `pysemco_tex` commands on a Unix socket until no request arrives in time.
+
+    If another server is already listening on the socket, this returns immediately.
+    Requests are handled one after another because each of them changes into
+    the working directory of its client.
+
+    Args:
+        path: The path of the Unix socket.
+        idle_timeout: The number of seconds without requests after which to exit.
+        run: The command line interface to run the commands with.
+    """
+    from .tokens.lexers import preload_lexers
+
+    if _is_listening(path):
+        return
+    # Remove a socket left behind by a server that did not exit cleanly.
+    path.unlink(missing_ok=True)
+
+    cwd = os.getcwd()
+    with _Server(path, idle_timeout, run) as server:
+        inode = path.stat().st_ino
+        # Compile the lexers while the first client is still being started.
+        preload_lexers()
+        try:
+            while not server.idle:
+                server.handle_request()
+        finally:
+            os.chdir(cwd)
+            # Only remove the socket if it has not been replaced by a newer server.
+            if path.exists() and path.stat().st_ino == inode:
+                path.unlink()
+
+
+def forward(argv: list[str]) -> dict[str, Any] | None:
+    """Send a command line to the server listening on the client’s socket.
+
+    Returns:
+        The exit code and the output of the command, or None if no server is listening.
+    """
+    path = os.environ.get(socket_env, str(default_socket))
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return None
+
+        request = {"cwd": os.getcwd(), "argv": argv}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as f:
+            return json.load(f)
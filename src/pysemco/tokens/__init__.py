@@ -1,6 +1,10 @@
+from .binary import TokenFile as TokenFile
+from .binary import write_binary_tokens as write_binary_tokens
+from .columnar import ColumnarTokens as ColumnarTokens
 from .combine import combine_tokens as combine_tokens
 from .compute import compute_minimal_tokens as compute_minimal_tokens
 from .compute import compute_tokens as compute_tokens
+from .compute import compute_tokens_many as compute_tokens_many
 from .compute import compute_tokens_cpp as compute_tokens_cpp
 from .compute import compute_tokens_python as compute_tokens_python
 from .compute import compute_tokens_sync as compute_tokens_sync
@@ -0,0 +1,193 @@
+"""A binary file format for semantic tokens that can be loaded partially.
+
+The format consists of the following parts, where all integers are little-endian
+and each part after the header starts at a multiple of eight bytes:
+
+- A header containing `magic` and the sizes of the other parts.
+- The token types and modifiers, encoded in UTF-8 and separated by null bytes.
+- The line index, i.e. for each line (and the end of the code) the byte offset
+  at which it starts in the code, followed by the index of its first token.
+- The tokens in columns of fixed-width integers: line, starting column, length,
+  and index of the token type (32 bits each), and the modifiers as a bit field
+  (64 bits).
+- The code encoded in UTF-8.
+
+Lines are split as in `str.splitlines`, like in the converters, and the tokens are
+sorted by line. Loading a range of lines thus only reads the corresponding parts
+of the columns and the code, which `mmap` avoids reading the rest of the file for.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import BinaryIO, Final, final
+
+from .columnar import ColumnarTokens
+from .defs import SemanticTokens
+
+# The bytes at the start of each file, ending with the version of the format
+magic: Final = b"SEMCOTK\x01"
+
+# The magic bytes and the numbers of token types, modifiers, bytes of the string
+# table, lines, tokens, and bytes of the code
+_header = struct.Struct("<8sIIIIII")
+
+
+def _padding(size: int) -> int:
+    """The number of bytes needed to pad `size` to a multiple of eight."""
+    return -size % 8
+
+
+def _little_endian(column: array[int]) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column(typecode: str, data: bytes | memoryview) -> array[int]:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def is_binary_tokens(path: Path) -> bool:
+    """Whether the file at `path` uses the binary format (instead of JSON)."""
+    with open(path, "rb") as f:
+        return f.read(len(magic)) == magic
+
+
+def write_binary_tokens(f: BinaryIO, tokens: SemanticTokens) -> None:
+    """Write tokens to a file in the binary format.
+
+    Args:
+        f: The file to write to.
+        tokens: The tokens, which are sorted by line if they are not already.
+    """
+    cols = ColumnarTokens.from_tokens(tokens)
+    if any(a > b for a, b in zip(cols.line, cols.line[1:])):
+        cols = cols.select(sorted(range(len(cols)), key=cols.line.__getitem__))
+
+    strings = "\0".join([*cols.token_types, *cols.token_modifiers]).encode()
+    code = tokens.txt.encode()
+    lines = tokens.txt.splitlines(keepends=True)
+    text_offsets = array("I", [0])
+    for line in lines:
+        text_offsets.append(text_offsets[-1] + len(line.encode()))
+    token_offsets = array(
+        "I", (bisect_left(cols.line, i) for i in range(len(lines) + 1))
+    )
+
+    def write_padded(data: bytes) -> None:
+        f.write(data)
+        f.write(bytes(_padding(len(data))))
+
+    f.write(
+        _header.pack(
+            magic,
+            len(cols.token_types),
+            len(cols.token_modifiers),
+            len(strings),
+            len(lines),
+            len(cols),
+            len(code),
+        )
+    )
+    write_padded(strings)
+    write_padded(_little_endian(text_offsets) + _little_endian(token_offsets))
+    write_padded(
+        b"".join(
+            _little_endian(c)
+            for c in (cols.line, cols.start, cols.length, cols.type_id)
+        )
+    )
+    f.write(_little_endian(cols.modifier_bits))
+    f.write(code)
+
+
+@final
+class TokenFile:
+    """Tokens stored in the binary format, which are loaded on demand.
+
+    The file is memory-mapped, so that loading a range of lines only reads
+    the pages containing them.
+
+    Args:
+        path: The path of the file.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._map)
+        fields = _header.unpack_from(view)
+        assert fields[0] == magic, f"{path} is not a token file!"
+        num_types, num_mods, strings_size, num_lines, num_tokens, code_size = fields[1:]
+        self.num_lines: int = num_lines
+        self.num_tokens: int = num_tokens
+
+        pos = _header.size
+        strings = bytes(view[pos : pos + strings_size]).decode()
+        names = strings.split("\0") if num_types + num_mods > 0 else []
+        self.token_types = [sys.intern(s) for s in names[:num_types]]
+        self.token_modifiers = names[num_types:]
+        pos += strings_size + _padding(strings_size)
+
+        index_size = 4 * (num_lines + 1)
+        self._text_offsets = _column("I", view[pos : pos + index_size])
+        pos += index_size
+        self._token_offsets = _column("I", view[pos : pos + index_size])
+        pos += index_size + _padding(2 * index_size)
+
+        # The offsets of the line, start, length, type, and modifier columns
+        self._columns = [pos + i * 4 * num_tokens for i in range(4)]
+        pos += 16 * num_tokens
+        pos += _padding(16 * num_tokens)
+        self._columns.append(pos)
+        self._code = pos + 8 * num_tokens
+        self._code_size = code_size
+
+    def _columns_of(self, code: memoryview, lo: int, hi: int) -> ColumnarTokens:
+        """The tokens `lo` to `hi` together with the given part of the code."""
+
+        def column(i: int, typecode: str) -> array[int]:
+            size = 8 if typecode == "Q" else 4
+            base = self._columns[i]
+            return _column(typecode, self._view[base + size * lo : base + size * hi])
+
+        return ColumnarTokens(
+            bytes(code).decode(),
+            column(0, "I"),
+            column(1, "I"),
+            column(2, "I"),
+            column(3, "I"),
+            column(4, "Q"),
+            self.token_types,
+            self.token_modifiers,
+        )
+
+    def line_range(self, begin: int, end: int) -> SemanticTokens:
+        """The code and tokens of the lines `begin` to `end` (exclusive).
+
+        The lines are numbered relative to `begin` as in `SemanticTokens.line_range`.
+        """
+        begin, end, _ = slice(begin, end).indices(self.num_lines)
+        end = max(begin, end)
+        text_lo, text_hi = self._text_offsets[begin], self._text_offsets[end]
+        code = self._view[self._code + text_lo : self._code + text_hi]
+        lo, hi = self._token_offsets[begin], self._token_offsets[end]
+        return self._columns_of(code, lo, hi).shifted(-begin).to_tokens()
+
+    def tokens(self) -> SemanticTokens:
+        """All code and tokens, including tokens after the last line."""
+        code = self._view[self._code : self._code + self._code_size]
+        return self._columns_of(code, 0, self.num_tokens).to_tokens()
+
+    def close(self) -> None:
+        self._view.release()
+        self._map.close()
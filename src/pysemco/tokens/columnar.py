@@ -0,0 +1,201 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Sequence
+from itertools import accumulate, compress, islice
+from typing import final
+
+from .defs import SemanticToken, SemanticTokens, intern_modifiers
+
+
+def _take(column: array[int], indices: Sequence[int]) -> array[int]:
+    """The elements of the column at the given indices."""
+    return array(column.typecode, map(column.__getitem__, indices))
+
+
+@final
+class ColumnarTokens:
+    """Semantic tokens stored as one array per attribute instead of one object each.
+
+    The token types are stored as indices into `token_types` and the modifiers as
+    bit fields over `token_modifiers`, like in the LSP encoding.
+    Bulk operations (decoding, filtering, range queries) run over the arrays
+    without creating token objects. Range queries assume that the tokens are sorted
+    by position, which is the case for LSP and pygments tokens and after `sorted`.
+    """
+
+    def __init__(
+        self,
+        txt: str,
+        line: array[int],
+        start: array[int],
+        length: array[int],
+        type_id: array[int],
+        modifier_bits: array[int],
+        token_types: list[str],
+        token_modifiers: list[str],
+    ):
+        assert len(line) == len(start) == len(length) == len(type_id)
+        assert len(line) == len(modifier_bits)
+        self.txt = txt
+        self.line = line
+        self.start = start
+        self.length = length
+        self.type_id = type_id
+        self.modifier_bits = modifier_bits
+        self.token_types = token_types
+        self.token_modifiers = token_modifiers
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+    @staticmethod
+    def from_lsp(
+        data: Sequence[int],
+        token_types: list[str],
+        token_modifiers: list[str],
+        txt: str = "",
+    ) -> "ColumnarTokens":
+        """Decode the `data` array of LSP semantic tokens.
+
+        The relative positions are turned into absolute ones by cumulative sums,
+        where the sum of the starting columns restarts on each new line.
+
+        Args:
+            data: The integers encoding the tokens as five integers each.
+            token_types: The token type legend of the language server.
+            token_modifiers: The token modifier legend of the language server.
+            txt: The code the tokens refer to.
+        """
+        assert len(data) % 5 == 0
+        delta_line = data[0::5]
+        delta_start = data[1::5]
+        start = accumulate(
+            zip(delta_line, delta_start),
+            lambda col, d: d[1] if d[0] else col + d[1],
+            initial=0,
+        )
+        return ColumnarTokens(
+            txt,
+            array("I", accumulate(delta_line)),
+            array("I", islice(start, 1, None)),
+            array("I", data[2::5]),
+            array("I", data[3::5]),
+            array("Q", data[4::5]),
+            token_types,
+            token_modifiers,
+        )
+
+    @staticmethod
+    def from_tokens(tokens: SemanticTokens) -> "ColumnarTokens":
+        """Convert token objects, deriving the legends from the tokens."""
+        toks = tokens.toks
+        token_types = list(dict.fromkeys(t.token_type for t in toks))
+        token_modifiers = sorted({m for t in toks for m in t.token_modifiers})
+        type_ids = {t: i for i, t in enumerate(token_types)}
+        modifier_bits = {m: 1 << i for i, m in enumerate(token_modifiers)}
+        return ColumnarTokens(
+            tokens.txt,
+            array("I", (t.line for t in toks)),
+            array("I", (t.start for t in toks)),
+            array("I", (t.length for t in toks)),
+            array("I", (type_ids[t.token_type] for t in toks)),
+            array(
+                "Q",
+                (sum(modifier_bits[m] for m in t.token_modifiers) for t in toks),
+            ),
+            token_types,
+            token_modifiers,
+        )
+
+    def to_list(self) -> list[SemanticToken]:
+        """Convert the tokens to token objects."""
+        mod_sets: dict[int, frozenset[str]] = {}
+
+        def modifiers(bits: int) -> frozenset[str]:
+            if (mods := mod_sets.get(bits)) is None:
+                mods = intern_modifiers(
+                    self.token_modifiers[bit]
+                    for bit in range(bits.bit_length())
+                    if bits & (1 << bit)
+                )
+                mod_sets[bits] = mods
+            return mods
+
+        return [
+            SemanticToken(line, start, length, self.token_types[tid], modifiers(bits))
+            for line, start, length, tid, bits in zip(
+                self.line, self.start, self.length, self.type_id, self.modifier_bits
+            )
+        ]
+
+    def to_tokens(self) -> SemanticTokens:
+        """Convert the tokens to token objects together with the code."""
+        return SemanticTokens(self.txt, self.to_list())
+
+    def select(self, indices: Sequence[int]) -> "ColumnarTokens":
+        """The tokens at the given indices."""
+        return ColumnarTokens(
+            self.txt,
+            _take(self.line, indices),
+            _take(self.start, indices),
+            _take(self.length, indices),
+            _take(self.type_id, indices),
+            _take(self.modifier_bits, indices),
+            self.token_types,
+            self.token_modifiers,
+        )
+
+    def filter(self, mask: Iterable[bool]) -> "ColumnarTokens":
+        """The tokens for which the corresponding mask entry is true."""
+        return self.select(list(compress(range(len(self)), mask)))
+
+    def without_types(self, token_types: Iterable[str]) -> "ColumnarTokens":
+        """The tokens whose type is not among the given ones."""
+        names = set(token_types)
+        excluded = {i for i, t in enumerate(self.token_types) if t in names}
+        return self.filter(tid not in excluded for tid in self.type_id)
+
+    def sorted(self) -> "ColumnarTokens":
+        """The tokens sorted by line, starting column, and ending column."""
+        keys = list(zip(self.line, self.start, self.length))
+        return self.select(sorted(range(len(self)), key=keys.__getitem__))
+
+    def line_bounds(self, begin: int, end: int) -> tuple[int, int]:
+        """The index range of the tokens in the lines `begin` to `end` (exclusive)."""
+        return bisect_left(self.line, begin), bisect_left(self.line, end)
+
+    def line_range(self, begin: int, end: int) -> "ColumnarTokens":
+        """The tokens in the lines `begin` to `end` (exclusive)."""
+        lo, hi = self.line_bounds(begin, end)
+        return ColumnarTokens(
+            self.txt,
+            self.line[lo:hi],
+            self.start[lo:hi],
+            self.length[lo:hi],
+            self.type_id[lo:hi],
+            self.modifier_bits[lo:hi],
+            self.token_types,
+            self.token_modifiers,
+        )
+
+    def shifted(self, lines: int) -> "ColumnarTokens":
+        """The tokens moved down by the given (possibly negative) number of lines."""
+        return ColumnarTokens(
+            self.txt,
+            array("I", (line + lines for line in self.line)),
+            self.start,
+            self.length,
+            self.type_id,
+            self.modifier_bits,
+            self.token_types,
+            self.token_modifiers,
+        )
+
+    def overlapping(self, line: int, start: int, end: int) -> list[int]:
+        """The indices of the tokens in `line` that overlap the given columns."""
+        lo, hi = self.line_bounds(line, line + 1)
+        return [
+            i
+            for i in range(lo, hi)
+            if self.start[i] < end and self.start[i] + self.length[i] > start
+        ]
@@ -1,6 +1,51 @@
+from collections.abc import Iterator
+from itertools import pairwise
+
 from .defs import SemanticToken
 
 
+def _key(tok: SemanticToken) -> tuple[int, int, int]:
+    """The position of a token as (line, starting column, ending column)."""
+    return tok.line, tok.start, tok.end
+
+
+def _sorted(toks: list[SemanticToken]) -> list[SemanticToken]:
+    """The tokens sorted by position, which they usually are already."""
+    if all(_key(a) <= _key(b) for a, b in pairwise(toks)):
+        return toks
+    return sorted(toks, key=_key)
+
+
+def _merge(
+    primary: list[SemanticToken],
+    secondary: list[SemanticToken],
+) -> Iterator[tuple[SemanticToken, bool]]:
+    """Merge two sorted lists of tokens, pairing each token with its “kind”.
+
+    The kind denotes whether a token is from the primary list. Tokens at the same
+    position are ordered as in a stable sort of the concatenated lists.
+    """
+    i, j = 0, 0
+    while i < len(primary) and j < len(secondary):
+        if _key(secondary[j]) < _key(primary[i]):
+            yield secondary[j], False
+            j += 1
+        else:
+            yield primary[i], True
+            i += 1
+    for tok in primary[i:]:
+        yield tok, True
+    for tok in secondary[j:]:
+        yield tok, False
+
+
+def _span(tok: SemanticToken, start: int, end: int) -> SemanticToken:
+    """A copy of the token covering the given columns instead."""
+    return SemanticToken(
+        tok.line, start, end - start, tok.token_type, tok.token_modifiers
+    )
+
+
 def combine_tokens(
     primary: list[SemanticToken],
     secondary: list[SemanticToken],
@@ -9,27 +54,26 @@ def combine_tokens(
 
     The implementation gives preference to the primary list if tokens overlap and
     assumes that either list does not contain overlapping tokens.
+    Both lists are expected to be sorted by position (and sorted if they are not),
+    which allows merging them in linear time. The input tokens are not modified;
+    tokens that need to be trimmed or extended are replaced by new ones.
 
     Args:
         primary: The primary tokens.
         secondary: The secondary tokens.
     """
 
-    from copy import deepcopy
-
-    # Merge the two lists and sort the tokens lexicographically according to
+    # Merge the two lists lexicographically according to
     # (line, starting column, ending column).
     # Each token is paired with a Boolean denoting whether it is from the primary list,
     # later called its “kind”.
-    comb = sorted(
-        [(tok, True) for tok in deepcopy(primary)]
-        + [(tok, False) for tok in deepcopy(secondary)],
-        key=lambda v: (v[0].line, v[0].start, v[0].end),
-    )
-    out = [comb.pop(0)]
+    comb = _merge(_sorted(primary), _sorted(secondary))
+    if (first := next(comb, None)) is None:
+        return []
+    out = [first]
     for tok, tokkind in comb:
         # Get the preceding token and its kind.
-        lasttok, _lastkind = out[-1]
+        lasttok, lastkind = out[-1]
 
         if tok == lasttok:
             # Skip duplicate tokens.
@@ -47,23 +91,23 @@ def combine_tokens(
             and tok.token_modifiers == lasttok.token_modifiers
         ):
             # If the overlapping tokens are of the same type, extend the existing token.
-            lasttok.end = max(tok.end, lasttok.end)
+            if tok.end > lasttok.end:
+                out[-1] = (_span(lasttok, lasttok.start, tok.end), lastkind)
             continue
 
         if tokkind:
             # If the new token is from the primary list, cut off the tail
             # of the preceding token and remove it if nothing remains.
-            lasttok.end = tok.start
-            if lasttok.length == 0:
+            if tok.start == lasttok.start:
                 out.pop()
+            else:
+                out[-1] = (_span(lasttok, lasttok.start, tok.start), lastkind)
         else:
             # If the new token is from the secondary list, cut off its head
             # and ignore it if nothing remains.
-            end = tok.end
-            tok.start = lasttok.end
-            tok.end = end
-            if tok.length == 0:
+            if tok.end == lasttok.end:
                 continue
+            tok = _span(tok, lasttok.end, tok.end)
         # Add the new token.
         out.append((tok, tokkind))
 
@@ -1,15 +1,65 @@
+from collections.abc import AsyncGenerator, Coroutine, Iterable
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from ..lsp.pool import LanguageServerPool
 
 from .combine import combine_tokens
 from .defs import SemanticToken, SemanticTokens, StrPath
 from .semantic import semantic_tokens
 
 
+def _map_clangd(tokens: list[SemanticToken]) -> list[SemanticToken]:
+    """Adapt clangd’s tokens to the token types used by SemCo."""
+    # Special case: clangd represents non-type template parameters
+    # as `typeParameter` with the `readonly` modifier
+    return [
+        (
+            t.with_token_type("parameter")
+            if t.token_type == "typeParameter" and "readonly" in t.token_modifiers
+            else t
+        )
+        for t in tokens
+        if t.token_type != "operator"
+    ]
+
+
+def _map_pyright(tokens: list[SemanticToken]) -> list[SemanticToken]:
+    """Adapt Pyright’s tokens to the token types used by SemCo."""
+    return [
+        (
+            t.with_token_type("parameter")
+            if t.token_type in ("selfParameter", "clsParameter")
+            else t
+        )
+        for t in tokens
+    ]
+
+
+def select_lines(txt: str, lines: tuple[int, int] | None) -> str:
+    """The given range of lines (beginning and end, exclusive) of the code.
+
+    Lines are separated by newlines as in LSP positions. If no range is given,
+    the whole code is returned.
+    """
+    if lines is None:
+        return txt
+    begin, end = lines
+    parts = txt.split("\n")
+    selected = "\n".join(parts[begin:end])
+    return selected + "\n" if end < len(parts) else selected
+
+
 async def compute_tokens_cpp(
     root: StrPath,
     file: StrPath,
     txt: str | None = None,
     log_lsp: bool = False,
+    pool: "LanguageServerPool | None" = None,
+    lines: tuple[int, int] | None = None,
 ) -> SemanticTokens:
     """Compute C++ tokens by combining clangd’s and pygments’ tokens.
 
@@ -18,10 +68,12 @@ async def compute_tokens_cpp(
         file: The path of the C++ file relative to root (or absolute).
         txt: The contents of `file`, which can be provided to avoid file I/O.
         log_lsp: Whether to log clangd’s state.
+        pool: The pool to take clangd from, by default the shared one.
+        lines: The range of lines (beginning and end, exclusive) to compute tokens
+            for, which are then numbered relative to its first line. Pygments only
+            lexes these lines, which thus should not start within a comment or string.
     """
-    from multilspy.language_server import MultilspyLogger
-
-    from ..lsp.clangd import ClangdServer
+    from ..lsp.pool import default_pool
     from .pygments import pygments_tokens
 
     root = Path(root).resolve()
@@ -31,26 +83,16 @@ async def compute_tokens_cpp(
         with open(file, "r") as f:
             txt = f.read()
 
-    tokens_clangd = await semantic_tokens(
-        ClangdServer(MultilspyLogger(), root, log_lsp=log_lsp),
-        file,
-        txt,
-    )
-
-    # Special case: clangd represents non-type template parameters
-    # as `typeParameter` with the `readonly` modifier
-    tokens_clangd = [
-        (
-            t.with_token_type("parameter")
-            if t.token_type == "typeParameter" and "readonly" in t.token_modifiers
-            else t
-        )
-        for t in tokens_clangd
-        if t.token_type != "operator"
-    ]
+    if pool is None:
+        pool = default_pool()
+    async with pool.session("cpp", root, log_lsp=log_lsp) as lsp:
+        tokens_clangd = await semantic_tokens(lsp, file, txt, lines)
 
+    txt = select_lines(txt, lines)
     tokens_pygments = pygments_tokens("cpp", txt)
-    return SemanticTokens(txt, combine_tokens(tokens_clangd, tokens_pygments))
+    return SemanticTokens(
+        txt, combine_tokens(_map_clangd(tokens_clangd), tokens_pygments)
+    )
 
 
 async def compute_tokens_python(
@@ -58,6 +100,8 @@ async def compute_tokens_python(
     file: StrPath,
     txt: str | None = None,
     log_lsp: bool = False,
+    pool: "LanguageServerPool | None" = None,
+    lines: tuple[int, int] | None = None,
 ) -> SemanticTokens:
     """Compute Python tokens by combining my pyright fork’s and pygments’ tokens.
 
@@ -66,10 +110,12 @@ async def compute_tokens_python(
         file: The path of the Python file relative to root (or absolute).
         txt: The contents of `file`, which can be provided to avoid file I/O.
         log_lsp: Whether to log Pyright’s state.
+        pool: The pool to take Pyright from, by default the shared one.
+        lines: The range of lines (beginning and end, exclusive) to compute tokens
+            for, which are then numbered relative to its first line. Pygments only
+            lexes these lines, which thus should not start within a comment or string.
     """
-    from multilspy.language_server import MultilspyLogger
-
-    from ..lsp.pyright import PyrightServer
+    from ..lsp.pool import default_pool
     from .pygments import pygments_tokens
 
     root = Path(root).resolve()
@@ -79,18 +125,16 @@ async def compute_tokens_python(
         with open(file, "r") as f:
             txt = f.read()
 
-    def map_pyright(tok: SemanticToken):
-        if tok.token_type in ("selfParameter", "clsParameter"):
-            tok.token_type = "parameter"
-        return tok
-
-    tokens_pyright = await semantic_tokens(
-        PyrightServer(MultilspyLogger(), root, log_lsp=log_lsp), file, txt
-    )
-    tokens_pyright = [map_pyright(tok) for tok in tokens_pyright]
+    if pool is None:
+        pool = default_pool()
+    async with pool.session("python", root, log_lsp=log_lsp) as lsp:
+        tokens_pyright = await semantic_tokens(lsp, file, txt, lines)
 
+    txt = select_lines(txt, lines)
     tokens_pygments = pygments_tokens("python", txt)
-    return SemanticTokens(txt, combine_tokens(tokens_pyright, tokens_pygments))
+    return SemanticTokens(
+        txt, combine_tokens(_map_pyright(tokens_pyright), tokens_pygments)
+    )
 
 
 async def compute_tokens(
@@ -99,6 +143,8 @@ async def compute_tokens(
     file: StrPath,
     txt: str | None = None,
     log_lsp: bool = False,
+    pool: "LanguageServerPool | None" = None,
+    lines: tuple[int, int] | None = None,
 ) -> SemanticTokens:
     """Compute tokens for the given language using appropriate methods.
 
@@ -108,29 +154,148 @@ async def compute_tokens(
         file: The path of the source file relative to root (or absolute).
         txt: The contents of `file`, which can be provided to avoid file I/O.
         log_lsp: Whether to log the language server’s state, if any.
+        pool: The pool to take the language server from, by default the shared one.
+        lines: The range of lines (beginning and end, exclusive) to compute tokens
+            for, which are then numbered relative to its first line. Pygments only
+            lexes these lines, which thus should not start within a comment or string.
     """
     from .pygments import pygments_tokens
 
     match lang:
         case "cpp":
-            return await compute_tokens_cpp(root, file, txt, log_lsp=log_lsp)
+            return await compute_tokens_cpp(root, file, txt, log_lsp, pool, lines)
         case "python":
-            return await compute_tokens_python(root, file, txt, log_lsp=log_lsp)
+            return await compute_tokens_python(root, file, txt, log_lsp, pool, lines)
         case "nasm":
             if txt is None:
                 with open(Path(root) / file, "r") as f:
                     txt = f.read()
+            txt = select_lines(txt, lines)
             return SemanticTokens(txt, pygments_tokens(lang, txt))
         case _:
             raise Exception(f"Unsupported language {lang!r}!")
 
 
+async def compute_tokens_many(
+    lang: str,
+    root: StrPath,
+    files: Iterable[StrPath],
+    log_lsp: bool = False,
+    pool: "LanguageServerPool | None" = None,
+    max_workers: int | None = None,
+) -> AsyncGenerator[tuple[Path, SemanticTokens]]:
+    """Compute tokens for many files of one project concurrently.
+
+    All files are opened on one shared language server, their semantic tokens are
+    requested concurrently, and the pygments tokens are computed in a process pool
+    in the meantime. The results are yielded in the order in which they finish.
+
+    Args:
+        lang: The language used.
+        root: The root directory of the workspace of the project.
+        files: The paths of the source files relative to root (or absolute).
+        log_lsp: Whether to log the language server’s state, if any.
+        pool: The pool to take the language server from, by default the shared one.
+        max_workers: The number of processes used for pygments.
+    """
+    import asyncio
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    from ..lsp.pool import default_pool
+    from .pygments import pygments_tokens
+
+    match lang:
+        case "cpp":
+            map_lsp = _map_clangd
+        case "python":
+            map_lsp = _map_pyright
+        case "nasm":
+            map_lsp = None
+        case _:
+            raise Exception(f"Unsupported language {lang!r}!")
+
+    root = Path(root).resolve()
+    txts: dict[Path, str] = {}
+    for file in files:
+        file = (root / file).resolve()
+        with open(file, "r") as f:
+            txts[file] = f.read()
+
+    # Forking this process, which runs the event loop and the language servers’
+    # reader threads, could deadlock the workers, so they start from a clean process.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers, mp_context=context) as executor:
+        lexed = {
+            file: loop.run_in_executor(executor, pygments_tokens, lang, txt)
+            for file, txt in txts.items()
+        }
+
+        if map_lsp is None:
+
+            async def lex(file: Path) -> tuple[Path, SemanticTokens]:
+                return file, SemanticTokens(txts[file], await lexed[file])
+
+            for fut in asyncio.as_completed([lex(file) for file in txts]):
+                yield await fut
+            return
+
+        if pool is None:
+            pool = default_pool()
+        async with pool.session(lang, root, log_lsp=log_lsp) as lsp:
+
+            async def compute(file: Path) -> tuple[Path, SemanticTokens]:
+                tokens_lsp = map_lsp(await semantic_tokens(lsp, file, txts[file]))
+                tokens_pygments = await lexed[file]
+                return file, SemanticTokens(
+                    txts[file], combine_tokens(tokens_lsp, tokens_pygments)
+                )
+
+            for fut in asyncio.as_completed([compute(file) for file in txts]):
+                yield await fut
+
+
+_runner: "asyncio.Runner | None" = None
+
+
+def _close_runner() -> None:
+    """Shut down the shared language servers and the event loop they run in."""
+    from ..lsp.pool import default_pool
+
+    global _runner
+    if _runner is not None:
+        _runner.run(default_pool().close())
+        _runner.close()
+        _runner = None
+
+
+def run_sync[T](coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on an event loop that persists across calls.
+
+    Reusing the event loop allows the shared language server pool to keep
+    its servers running between synchronous token computations.
+    """
+    import asyncio
+    import atexit
+
+    global _runner
+    if _runner is None:
+        _runner = asyncio.Runner()
+        atexit.register(_close_runner)
+    return _runner.run(coro)
+
+
 def compute_tokens_sync(
     lang: str,
     root: StrPath,
     file: StrPath,
     txt: str | None = None,
     log_lsp: bool = False,
+    lines: tuple[int, int] | None = None,
 ) -> SemanticTokens:
     """Compute tokens for the given language synchronously using appropriate methods.
 
@@ -140,10 +305,10 @@ def compute_tokens_sync(
         file: The path of the source file relative to root (or absolute).
         txt: The contents of `file`, which can be provided to avoid file I/O.
         log_lsp: Whether to log the language server’s state, if any.
+        lines: The range of lines (beginning and end, exclusive) to compute tokens
+            for, which are then numbered relative to its first line.
     """
-    import asyncio
-
-    return asyncio.run(compute_tokens(lang, root, file, txt, log_lsp=log_lsp))
+    return run_sync(compute_tokens(lang, root, file, txt, log_lsp=log_lsp, lines=lines))
 
 
 def compute_minimal_tokens(lang: str, txt: str, name_map: dict[str, str] | None = None):
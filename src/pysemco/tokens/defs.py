@@ -1,30 +1,88 @@
+import sys
+from collections.abc import Iterable, Iterator
 from os import PathLike
 from typing import Any, final
 
 StrPath = str | PathLike[str]
 
+# The canonical instance of each set of token modifiers, which all tokens share
+_modifier_sets: dict[frozenset[str], frozenset[str]] = {}
+
+
+def intern_modifiers(token_modifiers: Iterable[str]) -> frozenset[str]:
+    """The canonical immutable set containing the given token modifiers."""
+    mods = frozenset(token_modifiers)
+    return _modifier_sets.setdefault(mods, mods)
+
 
 @final
 class SemanticToken:
     """The information contained in an LSP semantic token.
 
     Here, the information is stored directly without fancy encoding.
+    As there are many tokens, they do not have an instance dictionary,
+    their token types are interned, and their modifiers are shared immutable sets.
     Note: Changing `start` also changes `end` because `length` remains unchanged.
+    Tokens are compared and hashed by value, so a token must not be changed
+    while it is contained in a set or used as a dictionary key.
     """
 
+    __slots__ = ("line", "start", "length", "token_type", "token_modifiers")
+
     def __init__(
         self,
         line: int,
         start: int,
         length: int,
         token_type: str,
-        token_modifiers: list[str],
+        token_modifiers: Iterable[str],
     ):
         self.line = line
         self.start = start
         self.length = length
-        self.token_type = token_type
-        self.token_modifiers = token_modifiers
+        self.token_type = sys.intern(token_type)
+        self.token_modifiers = intern_modifiers(token_modifiers)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SemanticToken):
+            return NotImplemented
+        return (
+            self.line == other.line
+            and self.start == other.start
+            and self.length == other.length
+            and self.token_type == other.token_type
+            and self.token_modifiers == other.token_modifiers
+        )
+
+    def __hash__(self) -> int:
+        return hash(
+            (
+                self.line,
+                self.start,
+                self.length,
+                self.token_type,
+                self.token_modifiers,
+            )
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"SemanticToken({self.line}, {self.start}, {self.length}, "
+            + f"{self.token_type!r}, {sorted(self.token_modifiers)!r})"
+        )
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Construct unpickled tokens anew to intern their type and modifiers.
+        return (
+            SemanticToken,
+            (
+                self.line,
+                self.start,
+                self.length,
+                self.token_type,
+                self.token_modifiers,
+            ),
+        )
 
     @property
     def end(self):
@@ -64,7 +122,13 @@ class SemanticToken:
 
     @property
     def json(self):
-        return self.__dict__
+        return {
+            "line": self.line,
+            "start": self.start,
+            "length": self.length,
+            "token_type": self.token_type,
+            "token_modifiers": sorted(self.token_modifiers),
+        }
 
 
 @final
@@ -75,6 +139,73 @@ class SemanticTokens:
         self.txt = txt
         self.toks = toks
 
+    def line_tokens(self, num_lines: int | None = None) -> list[list[SemanticToken]]:
+        """The tokens grouped by line in a single pass, keeping their order.
+
+        Args:
+            num_lines:
+                The number of lines to return token lists for, by default the number
+                of lines in the code. Tokens in later lines are ignored.
+        """
+        if num_lines is None:
+            num_lines = len(self.txt.splitlines())
+        lines: list[list[SemanticToken]] = [[] for _ in range(num_lines)]
+        for tok in self.toks:
+            if tok.line < num_lines:
+                lines[tok.line].append(tok)
+        return lines
+
+    def iter_lines(
+        self, lines: tuple[int, int] | None = None
+    ) -> Iterator[tuple[str, list[SemanticToken]]]:
+        """The lines of the code together with their tokens, keeping their order.
+
+        The lines are produced one at a time, so that stopping early skips most of
+        the work for the remaining lines. Tokens that are not sorted by line, which
+        pysemco never produces, are first sorted by line and start.
+
+        Args:
+            lines: The range of lines (beginning and end, exclusive) to return,
+                by default all lines. Negative bounds count from the end as in slices.
+        """
+        from bisect import bisect_left
+        from operator import attrgetter
+
+        txt_lines = self.txt.splitlines()
+        begin, end, _ = slice(*(lines or (None, None))).indices(len(txt_lines))
+        toks = self.toks
+        tok_lines = list(map(attrgetter("line"), toks))
+        # Sorting takes linear time for sorted input, which makes this a cheap check.
+        if tok_lines != (sorted_lines := sorted(tok_lines)):
+            toks = sorted(toks, key=attrgetter("line", "start"))
+            tok_lines = sorted_lines
+        lo = bisect_left(tok_lines, begin)
+        for i in range(begin, end):
+            hi = lo
+            while hi < len(tok_lines) and tok_lines[hi] == i:
+                hi += 1
+            yield txt_lines[i], toks[lo:hi]
+            lo = hi
+
+    def line_range(self, begin: int, end: int) -> "SemanticTokens":
+        """The code and tokens of the lines `begin` to `end` (exclusive).
+
+        The lines are split as in `str.splitlines` and renumbered to start at zero.
+        Negative bounds count from the end as in slices.
+        """
+        lines = self.txt.splitlines(keepends=True)
+        begin, end, _ = slice(begin, end).indices(len(lines))
+        return SemanticTokens(
+            "".join(lines[begin:end]),
+            [
+                SemanticToken(
+                    t.line - begin, t.start, t.length, t.token_type, t.token_modifiers
+                )
+                for t in self.toks
+                if begin <= t.line < end
+            ],
+        )
+
     @staticmethod
     def from_json(json: dict[str, Any]) -> "SemanticTokens":
         return SemanticTokens(
@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right
+from typing import Final, final
+
+from .defs import SemanticToken, SemanticTokens
+
+
+@final
+class TokenIndex:
+    """An index for finding code segments and the tokens within them.
+
+    The lines are joined by newlines into one text, for which the offsets of the line
+    starts are stored. Occurrences of code segments are found using a lazily built
+    index of all substrings of length `gram_length`, so that each lookup only needs
+    to check the positions at which the segment’s first characters occur.
+    The tokens are grouped by line and located within a line by bisection.
+    """
+
+    gram_length: Final = 3
+
+    def __init__(self, tokens: SemanticTokens):
+        self.lines = tokens.txt.splitlines()
+        self.text = "\n".join(self.lines)
+        self.line_offsets: list[int] = []
+        offset = 0
+        for line in self.lines:
+            self.line_offsets.append(offset)
+            offset += len(line) + 1
+
+        self.line_tokens = tokens.line_tokens(len(self.lines))
+        self._line_starts = [[t.start for t in ts] for ts in self.line_tokens]
+        self._grams: dict[str, list[int]] | None = None
+
+    def _build_grams(self) -> dict[str, list[int]]:
+        """Map each substring of length `gram_length` to its offsets."""
+        grams: dict[str, list[int]] = {}
+        text, k = self.text, self.gram_length
+        for i in range(len(text) - k + 1):
+            gram = text[i : i + k]
+            if "\n" not in gram:
+                grams.setdefault(gram, []).append(i)
+        return grams
+
+    def _offsets(self, txt: str) -> list[int]:
+        """The offsets at which `txt` starts in the text."""
+        if len(txt) < self.gram_length:
+            offsets: list[int] = []
+            i = self.text.find(txt)
+            while i != -1:
+                offsets.append(i)
+                i = self.text.find(txt, i + 1)
+            return offsets
+
+        if self._grams is None:
+            self._grams = self._build_grams()
+        candidates = self._grams.get(txt[: self.gram_length], [])
+        return [i for i in candidates if self.text.startswith(txt, i)]
+
+    def find(self, txt: str) -> list[tuple[int, int, int]]:
+        """The occurrences of a single-line segment as (line, start column, end column).
+
+        The occurrences are ordered by position.
+        """
+        if "\n" in txt:
+            return []
+        occs: list[tuple[int, int, int]] = []
+        for offset in self._offsets(txt):
+            line = bisect_right(self.line_offsets, offset) - 1
+            start = offset - self.line_offsets[line]
+            # Only empty segments can start at the end of a line.
+            if start < len(self.lines[line]):
+                occs.append((line, start, start + len(txt)))
+        return occs
+
+    def overlapping(self, line: int, start: int, end: int) -> list[SemanticToken]:
+        """The tokens in the given line that overlap the given column range."""
+        toks = self.line_tokens[line]
+        hi = bisect_left(self._line_starts[line], end)
+        return [t for t in toks[:hi] if t.end > start]
+
+    def within(self, line: int, start: int, end: int) -> list[SemanticToken]:
+        """The tokens in the given line that are within the given column range."""
+        toks = self.line_tokens[line]
+        lo = bisect_left(self._line_starts[line], start)
+        hi = bisect_right(self._line_starts[line], end)
+        return [t for t in toks[lo:hi] if t.end <= end]
@@ -0,0 +1,41 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pygments.lexer import LexerMeta
+
+# The custom lexers by language, given by their module and class name,
+# which are only imported once they are used
+_custom_lexers = {
+    "cpp": ("cpp", "CppLexer"),
+    "cppalg": ("cpp", "CppAlgLexer"),
+    "nasm": ("nasm", "NasmLexer"),
+    "python": ("python", "PythonLexer"),
+}
+
+
+def get_lexer(lang: str) -> "LexerMeta":
+    """Get the lexer for the given language using the custom ones if available.
+
+    Only the module containing the lexer is imported, as importing and compiling
+    all lexers takes longer than lexing a typical snippet.
+    """
+    from importlib import import_module
+
+    if (custom := _custom_lexers.get(lang)) is not None:
+        module, name = custom
+        return getattr(import_module(f".{module}", __name__), name)
+
+    from pygments.lexers import find_lexer_class_by_name
+
+    return find_lexer_class_by_name(lang)
+
+
+def preload_lexers() -> None:
+    """Import the custom lexers and compile their regular expressions.
+
+    Pygments compiles the regular expressions of a lexer when it is first
+    instantiated, which long-running processes can do ahead of time using
+    this function.
+    """
+    for lang in _custom_lexers:
+        get_lexer(lang)()
@@ -0,0 +1,66 @@
+from typing import Final, override
+
+import pygments.token as token
+from pygments.lexer import inherit, words
+from pygments.lexers.c_cpp import CppLexer as _CppLexer
+
+
+class CppLexer(_CppLexer):
+    _keyword_kinds: Final = {
+        "auto": token.Keyword.Type,
+        "bool": token.Keyword.Type,
+        "char": token.Keyword.Type,
+        "char8_t": token.Keyword.Type,
+        "char16_t": token.Keyword.Type,
+        "char32_t": token.Keyword.Type,
+        "double": token.Keyword.Type,
+        "float": token.Keyword.Type,
+        "int": token.Keyword.Type,
+        "long": token.Keyword.Type,
+        "short": token.Keyword.Type,
+        "signed": token.Keyword.Type,
+        "unsigned": token.Keyword.Type,
+        "void": token.Keyword.Type,
+        "wchar_t": token.Keyword.Type,
+        "false": token.Keyword.Constant,
+        "true": token.Keyword.Constant,
+        "this": token.Keyword.Constant,
+        "operator": token.Keyword.Operator,
+    }
+    _builtin_kinds: Final = {
+        "false": token.Keyword.Constant,
+        "true": token.Keyword.Constant,
+        "nullptr": token.Keyword.Constant,
+        "NULL": token.Name.Macro,
+    }
+
+    @override
+    def get_tokens(self, text: str, unfiltered: bool = False):
+        """Replace the `Keyword` token kind with a more specific sub-kind."""
+        for ttype, tstr in super().get_tokens(text, unfiltered):
+            if ttype is token.Keyword:
+                yield CppLexer._keyword_kinds.get(tstr, ttype), tstr
+            elif ttype is token.Name.Builtin:
+                yield CppLexer._builtin_kinds.get(tstr, ttype), tstr
+            else:
+                yield ttype, tstr
+
+
+class CppAlgLexer(CppLexer):
+    tokens: Final = {
+        "keywords": [
+            inherit,
+            (words(("parallel", "process"), suffix=r"\b"), token.Keyword),
+        ],
+    }
+
+    @override
+    def get_tokens(self, text: str, unfiltered: bool = False):
+        """Replace the `Keyword` token kind with a more specific sub-kind."""
+        for ttype, tstr in super().get_tokens(text, unfiltered):
+            if ttype is token.Keyword:
+                yield CppLexer._keyword_kinds.get(tstr, ttype), tstr
+            elif ttype is token.Name.Builtin:
+                yield CppLexer._builtin_kinds.get(tstr, ttype), tstr
+            else:
+                yield ttype, tstr
@@ -0,0 +1,111 @@
+import re
+from typing import final, override
+
+import pygments.token as token
+from pygments.lexer import RegexLexer, bygroups, include
+
+
+@final
+class NasmLexer(RegexLexer):
+    """A nasm lexer based on pygments.lexers.asm.NasmLexer."""
+
+    identifier = r"[a-z$._?][\w$.?#@~]*"
+    hexn = r"(?:0x[0-9a-f]+|$0[0-9a-f]*|[0-9]+[0-9a-f]*h)"
+    octn = r"[0-7]+q"
+    binn = r"[01]+b"
+    decn = r"[0-9]+"
+    floatn = decn + r"\.e?" + decn
+    string = r'"(\\"|[^"\n])*"|' + r"'(\\'|[^'\n])*'|" + r"`(\\`|[^`\n])*`"
+    declkw = r"(?:res|d)[bwdqt]|times"
+    register = (
+        r"(r[0-9][0-5]?[bwd]?|"
+        r"[a-d][lh]|[er]?[a-d]x|[er]?[sb]p|[er]?[sd]i|[c-gs]s|st[0-7]|"
+        r"mm[0-7]|cr[0-4]|dr[0-367]|tr[3-7]|k[0-7]|"
+        r"[xyz]mm(?:[12][0-9]?|3[01]?|[04-9]))\b"
+    )
+    wordop = r"seg|wrt|strict|rel|abs"
+    # Support SIMD addresses, too
+    type = r"(([xyz]mmword|[dq]?word|byte) ptr)|byte|[dq]?word"
+    # Directives must be followed by whitespace, otherwise CPU will match
+    # cpuid for instance.
+    directives = (
+        r"(?:BITS|USE16|USE32|SECTION|SEGMENT|ABSOLUTE|EXTERN|GLOBAL|"
+        r"ORG|ALIGN|STRUC|ENDSTRUC|COMMON|CPU|GROUP|UPPERCASE|IMPORT|"
+        r"EXPORT|LIBRARY|MODULE)(?=\s)"
+    )
+    # Add broadcasts
+    broadcasts = r"(?<=\{)1to(2|4|8|16)(?=\})"
+
+    flags = re.IGNORECASE | re.MULTILINE
+    tokens = {
+        "root": [
+            (r"^\s*%", token.Comment.Preproc, "preproc"),
+            include("whitespace"),
+            # Allow anything before a colon to be a label
+            (r".*:", token.Name.Label),
+            (
+                rf"({identifier})(\s+)(equ)",
+                bygroups(
+                    token.Name.Constant, token.Whitespace, token.Keyword.Declaration
+                ),
+                "instruction-args",
+            ),
+            (directives, token.Keyword, "instruction-args"),
+            (declkw, token.Keyword.Declaration, "instruction-args"),
+            (identifier, token.Name.Function, "instruction-args"),
+            (r"[\r\n]+", token.Whitespace),
+        ],
+        "instruction-args": [
+            (broadcasts, token.Name.Attribute),
+            (string, token.String),
+            (hexn, token.Number.Hex),
+            (octn, token.Number.Oct),
+            (binn, token.Number.Bin),
+            (floatn, token.Number.Float),
+            (decn, token.Number.Integer),
+            include("punctuation"),
+            # Name.Builtin → Name.Variable
+            (register, token.Name.Variable),
+            (identifier, token.Name.Variable),
+            (r"[\r\n]+", token.Whitespace, "#pop"),
+            include("whitespace"),
+        ],
+        "preproc": [
+            (r"[^;\n]+", token.Comment.Preproc),
+            (r";.*?\n", token.Comment.Single, "#pop"),
+            (r"\n", token.Comment.Preproc, "#pop"),
+        ],
+        "whitespace": [
+            (r"\n", token.Whitespace),
+            (r"[ \t]+", token.Whitespace),
+            (r";.*", token.Comment.Single),
+            (r"#.*", token.Comment.Single),
+        ],
+        "punctuation": [
+            (r"[,{}():\[\]]+", token.Punctuation),
+            (r"[&|^<>+*/%~-]+", token.Operator),
+            (r"[$]+", token.Keyword.Constant),
+            (wordop, token.Operator.Word),
+            (type, token.Keyword.Type),
+        ],
+    }
+
+    @override
+    def get_tokens(self, text: str, unfiltered: bool = False):
+        """Fix up labels in the existing tokens.
+
+        The tokens are lexed once and buffered, since uses of a label can precede it.
+        """
+        toks = list(super().get_tokens(text, unfiltered))
+        # Store all labels without the terminating colon
+        labels = {tstr.rstrip(":") for tkind, tstr in toks if tkind is token.Name.Label}
+        for tkind, tstr in toks:
+            # Remove the colon from labels
+            if tkind is token.Name.Label:
+                yield token.Name.Label, tstr[:-1]
+                yield token.Punctuation, ":"
+                continue
+            # Mark any use of a label as a Name.Label.
+            if tstr in labels:
+                tkind = token.Name.Label
+            yield tkind, tstr
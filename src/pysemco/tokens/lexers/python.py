@@ -0,0 +1,15 @@
+from typing import override
+
+import pygments.token as token
+from pygments.lexers.python import PythonLexer as _PythonLexer
+
+
+class PythonLexer(_PythonLexer):
+    @override
+    def get_tokens(self, text: str, unfiltered: bool = False):
+        """Replace the `Keyword` token kind with a more specific sub-kind."""
+        for ttype, tstr in super().get_tokens(text, unfiltered):
+            if ttype is token.Operator.Word:
+                yield token.Keyword, tstr
+            else:
+                yield ttype, tstr
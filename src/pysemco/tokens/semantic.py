@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -5,78 +6,81 @@ if TYPE_CHECKING:
     from ..lsp import LanguageServer
     from multilspy.lsp_protocol_handler.lsp_types import (
         SemanticTokens as LspSemanticTokens,
+        SemanticTokensDelta as LspSemanticTokensDelta,
     )
 
 from .defs import SemanticToken
 
 
 def parse_semantic_tokens(
-    semantic_tokens: "LspSemanticTokens",
+    semantic_tokens: "LspSemanticTokens | LspSemanticTokensDelta",
     token_types: list[str],
     token_modifiers: list[str],
+    previous: Sequence[int] | None = None,
 ) -> list[SemanticToken]:
-    """Convert the semantic tokens provided by an LSP to pysemco’s tokens."""
-
-    tokens = semantic_tokens["data"]
-    assert len(tokens) % 5 == 0
-    prev: SemanticToken | None = None
-    trans: list[SemanticToken] = []
-    for i in range(0, len(tokens), 5):
-        delta_line, delta_start, length, token_type, token_mods_bf = tokens[i : i + 5]
-        token_type = token_types[token_type]
-        token_mods: list[str] = [
-            token_modifiers[bit]
-            for bit in range(token_mods_bf.bit_length())
-            if token_mods_bf & (1 << bit)
-        ]
-
-        if prev is None:
-            val = SemanticToken(
-                delta_line,
-                delta_start,
-                length,
-                token_type,
-                token_mods,
-            )
-        elif delta_line == 0:
-            val = SemanticToken(
-                prev.line,
-                prev.start + delta_start,
-                length,
-                token_type,
-                token_mods,
-            )
-        else:
-            val = SemanticToken(
-                prev.line + delta_line,
-                delta_start,
-                length,
-                token_type,
-                token_mods,
-            )
-        prev = val
-        trans.append(val)
-
-    return trans
+    """Convert the semantic tokens provided by an LSP to pysemco’s tokens.
+
+    Args:
+        semantic_tokens: The semantic tokens or the delta to earlier ones.
+        token_types: The token type legend of the LSP.
+        token_modifiers: The token modifier legend of the LSP.
+        previous: The `data` array of the earlier tokens, which is required for deltas.
+    """
+
+    from .columnar import ColumnarTokens
+
+    if "edits" in semantic_tokens:
+        from ..lsp.language_server import apply_semantic_token_edits
+
+        assert previous is not None, "A delta requires the previous tokens!"
+        data = apply_semantic_token_edits(previous, semantic_tokens["edits"])
+    else:
+        data = semantic_tokens["data"]
+    return ColumnarTokens.from_lsp(data, token_types, token_modifiers).to_list()
 
 
 async def semantic_tokens(
     lsp: "LanguageServer",
     file: Path,
     contents: str | None = None,
+    lines: tuple[int, int] | None = None,
 ) -> list[SemanticToken]:
-    """Compute and convert semantic tokens for the given file using the given LSP."""
+    """Compute and convert semantic tokens for the given file using the given LSP.
 
-    async with lsp.start_server():
+    If the LSP has not been started yet, it is started for this request only.
+
+    Args:
+        lsp: The language server.
+        file: The absolute path of the file.
+        contents: The contents of the file, which are read from it if not given.
+        lines: The range of lines (beginning and end, exclusive) to compute tokens for,
+            which are then numbered relative to its first line.
+    """
+    from .columnar import ColumnarTokens
+
+    if not lsp.server_started:
+        async with lsp.start_server():
+            return await semantic_tokens(lsp, file, contents, lines)
+
+    if lines is None:
         raw_tokens = await lsp.semantic_tokens(file, contents)
-        assert raw_tokens is not None
+    else:
+        raw_tokens = await lsp.semantic_tokens_range(file, *lines, contents)
+    assert raw_tokens is not None
 
-        resp = getattr(lsp, "init_response", None)
-        assert resp is not None
-        legend = resp["capabilities"]["semanticTokensProvider"]["legend"]  # type: ignore
+    resp = getattr(lsp, "init_response", None)
+    assert resp is not None
+    legend = resp["capabilities"]["semanticTokensProvider"]["legend"]  # type: ignore
 
+    if lines is None:
         return parse_semantic_tokens(
             raw_tokens,
             legend["tokenTypes"],
             legend["tokenModifiers"],
         )
+    begin, end = lines
+    tokens = ColumnarTokens.from_lsp(
+        raw_tokens["data"], legend["tokenTypes"], legend["tokenModifiers"]
+    )
+    # The server may return tokens outside of the range.
+    return tokens.line_range(begin, end).shifted(-begin).to_list()
@@ -0,0 +1,184 @@
+"""Following source files to keep their analyses up to date.
+
+The files to follow are listed in a watch list, to which `pysemco_tex analyze` adds
+its inputs and outputs. Changes are detected using inotify on Linux, which is
+accessed through ctypes, and by polling the files’ metadata elsewhere.
+"""
+
+import json
+import os
+import select
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import final
+
+from .serialization import deserialize, serialize
+from .state import lock, write_atomic
+
+
+@dataclass
+class WatchEntry:
+    """A source file whose analysis is kept up to date."""
+
+    language: str
+    root: Path
+    src: Path
+    dst: Path
+    # The range of lines analyzed (beginning and end, exclusive), empty for all lines
+    lines: list[int]
+
+
+def read_watch_list(path: Path) -> list[WatchEntry]:
+    """The entries of the watch list at `path`, which are empty if it does not exist."""
+    if not path.exists():
+        return []
+    with open(path, "r") as f:
+        return deserialize(json.load(f), list[WatchEntry])
+
+
+def register(path: Path, entry: WatchEntry) -> None:
+    """Add an entry to the watch list at `path`, replacing the one with the same output.
+
+    The watch list is only written if it changes. Concurrent registrations, e.g.
+    by parallel `pysemco_tex analyze` calls, are serialized by the lock named
+    “watch”, while readers rely on the atomic replacement.
+    """
+    with lock("watch"):
+        entries = read_watch_list(path)
+        if entry in entries:
+            return
+        entries = [e for e in entries if e.dst != entry.dst] + [entry]
+        write_atomic(path, json.dumps(serialize(entries), indent=2))
+
+
+# A file’s identity, modification time, and size, or None if it does not exist
+_Stamp = tuple[int, int, int] | None
+
+
+def _stamp(path: Path) -> _Stamp:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@final
+class _Inotify:
+    """A minimal inotify binding that reports whether watched directories changed."""
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    # | IN_CREATE | IN_DELETE
+    _mask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: set[Path] = set()
+
+    def watch(self, directory: Path) -> None:
+        """Report changes to the files in the given directory."""
+        if directory in self._dirs or not directory.is_dir():
+            return
+        if self._add_watch(self.fd, os.fsencode(directory), self._mask) >= 0:
+            self._dirs.add(directory)
+
+    def wait(self, timeout: float | None) -> bool:
+        """Wait for events for at most `timeout` seconds and consume them.
+
+        Returns:
+            Whether any event has occurred.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+@final
+class FileWatcher:
+    """Wait for changes to a set of files.
+
+    Whether a file has changed is determined by comparing its metadata to the state
+    reported by the last call to `wait`. inotify is only used to avoid polling and
+    watches the files’ directories, which also covers editors that replace a file
+    instead of writing to it.
+
+    Args:
+        interval: The number of seconds between two checks when polling.
+        debounce: The number of seconds to wait for further changes after a change.
+    """
+
+    def __init__(self, interval: float = 1.0, debounce: float = 0.05):
+        self.interval = interval
+        self.debounce = debounce
+        self._stamps: dict[Path, _Stamp] = {}
+        try:
+            self._inotify: _Inotify | None = _Inotify()
+        except (OSError, AttributeError):
+            self._inotify = None
+
+    def _changed(self, paths: list[Path]) -> set[Path]:
+        """The files that have changed since they were last reported."""
+        changed: set[Path] = set()
+        for path in paths:
+            stamp = _stamp(path)
+            if stamp != self._stamps.get(path):
+                self._stamps[path] = stamp
+                if stamp is not None:
+                    changed.add(path)
+        return changed
+
+    def wait(self, paths: Iterable[Path], timeout: float | None = None) -> set[Path]:
+        """Wait until some of the given files change and return the changed ones.
+
+        Files that have not been passed before are reported as changed immediately
+        if they exist, while files that are removed are not reported.
+
+        Args:
+            paths: The files to watch.
+            timeout: The maximum number of seconds to wait, or None to wait forever.
+        """
+        paths = list(paths)
+        if self._inotify is not None:
+            for path in paths:
+                self._inotify.watch(path.parent)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(changed := self._changed(paths)) == 0:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            if self._inotify is not None:
+                self._inotify.wait(remaining)
+            else:
+                time.sleep(
+                    self.interval
+                    if remaining is None
+                    else min(remaining, self.interval)
+                )
+            # Let a burst of writes settle before looking at the files.
+            time.sleep(self.debounce)
+        return changed
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
@@ -0,0 +1,29 @@
+from pysemco import SemanticToken, SemanticTokens, html_style_google, to_html
+
+
+def _tokens(order: list[int]) -> SemanticTokens:
+    toks = [
+        SemanticToken(0, 0, 3, "keyword", []),
+        SemanticToken(0, 4, 1, "variable", []),
+        SemanticToken(2, 0, 6, "function", []),
+        SemanticToken(2, 7, 1, "number", []),
+    ]
+    return SemanticTokens("int x\n\nreturn 0", [toks[i] for i in order])
+
+
+def test_iter_lines_unsorted():
+    sorted_tokens = _tokens([0, 1, 2, 3])
+    unsorted_tokens = _tokens([2, 0, 3, 1])
+    assert list(unsorted_tokens.iter_lines()) == list(sorted_tokens.iter_lines())
+    assert list(unsorted_tokens.iter_lines((1, 3))) == [
+        ("", []),
+        ("return 0", sorted_tokens.toks[2:]),
+    ]
+
+
+def test_to_html_unsorted():
+    sorted_tokens = _tokens([0, 1, 2, 3])
+    unsorted_tokens = _tokens([3, 2, 1, 0])
+    assert to_html(unsorted_tokens, html_style_google) == to_html(
+        sorted_tokens, html_style_google
+    )